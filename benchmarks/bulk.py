@@ -0,0 +1,91 @@
+"""
+Benchmark the bulk request engine for batch sizes from 1 to 10,000.
+
+Compares the previous engine, which started one thread per item and collected
+the responses through a `multiprocessing.Queue`, with the current engine,
+which gathers the items as asyncio tasks and runs synchronous handlers in a
+bounded thread pool.
+
+Run from the repository root with:
+
+    python -m benchmarks.bulk
+"""
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import threading
+import time
+import types
+
+from brontosaurus import API
+from brontosaurus.compile_dispatch import compile_dispatch
+from brontosaurus.compile_validators import compile_validators, validate
+from brontosaurus.create_sanic_server import _handle_bulk_resp
+from brontosaurus.json_codec import get_json_codec
+from brontosaurus.validate_envelope import validate_envelope
+
+_BATCH_SIZES = (1, 10, 100, 1000, 10000)
+
+api = API('Bulk benchmark', 'Bulk benchmark API', doc_path=None)
+
+
+@api.method('echo', 'Echo a message')
+@api.params({'type': 'object', 'required': ['message'], 'properties': {'message': {'type': 'string'}}})
+def echo(params, headers):
+    return {'message': params['message']}
+
+
+def _legacy_handle_item(req, req_json, resp_queue):
+    """
+    Do the same work as a bulk item, the way the previous engine ran it.
+    """
+    validate_envelope(req_json)
+    meth = api.methods[api.method_names[req_json['method']]]
+    validate(meth['params_validator'], req_json['params'])
+    result = meth['func'](req_json['params'], dict(req.headers))
+    resp_queue.put({'jsonrpc': '2.0', 'id': req_json['id'], 'result': result})
+
+
+def _legacy_bulk(req, req_json):
+    threads = []
+    resp_queue = multiprocessing.Queue()
+    for each in req_json:
+        thread = threading.Thread(target=_legacy_handle_item, args=(req, each, resp_queue), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return [resp_queue.get() for _ in req_json]
+
+
+def main():
+    compile_validators(api)
+    req = types.SimpleNamespace(headers={})
+    loop = asyncio.new_event_loop()
+    server = {
+        'dispatch': compile_dispatch(api),
+        'development': False,
+        'executor': concurrent.futures.ThreadPoolExecutor(),
+        'bulk_semaphore': None,
+        'json_codec': get_json_codec(),
+        'error_cache': {},
+        'metrics': None,
+    }
+    print(f"{'batch size':>10}{'previous (items/s)':>22}{'current (items/s)':>22}{'speedup':>10}")
+    for size in _BATCH_SIZES:
+        req_json = [{'id': idx, 'method': 'echo', 'params': {'message': 'hi'}} for idx in range(size)]
+        start = time.perf_counter()
+        _legacy_bulk(req, req_json)
+        previous = size / (time.perf_counter() - start)
+        start = time.perf_counter()
+        (body, status) = loop.run_until_complete(_handle_bulk_resp(server, req.headers, req_json, None))
+        current = size / (time.perf_counter() - start)
+        assert [resp['id'] for resp in json.loads(body)] == list(range(size))
+        print(f'{size:>10}{previous:>22.0f}{current:>22.0f}{current / previous:>9.1f}x')
+    server['executor'].shutdown()
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark rendering the Markdown docs of large, deeply nested schemas.
+
+Renders an API with a single type made of nested objects, for growing
+numbers of properties and levels of nesting. The render time per property
+should stay about the same as the schema grows, in both dimensions.
+
+Run from the repository root with:
+
+    python -m benchmarks.docs
+"""
+import os
+import tempfile
+import time
+
+from brontosaurus import API
+from brontosaurus.generate_docs import generate_single_docs
+
+
+def _nested_schema(depth, properties):
+    """
+    An object schema nested `depth` levels deep, with `properties` properties
+    in total spread over the levels.
+    """
+    per_level = max(properties // depth, 1)
+    schema = None
+    for level in reversed(range(depth)):
+        props = {
+            f'prop_{level}_{idx}': {
+                'type': 'string',
+                'description': f'Property {idx} of level {level}',
+                'enum': ['a', 'b'],
+            }
+            for idx in range(per_level)
+        }
+        if schema is not None:
+            props['child'] = schema
+        schema = {
+            'type': 'object',
+            'required': list(props)[::2],
+            'additionalProperties': False,
+            'properties': props,
+        }
+    return schema
+
+
+def _bench(depth, properties, tmp_dir, repeat=3):
+    """
+    Return the best time in seconds, and the size in bytes, of rendering the docs.
+    """
+    doc_path = os.path.join(tmp_dir, f'{depth}-{properties}.md')
+    api = API('Large schemas', 'Benchmark API', doc_path)
+    schema = _nested_schema(depth, properties)
+    schema['$id'] = '#large'
+    api.register(schema)
+    durations = []
+    for _ in range(repeat):
+        # Remove the docs, as they are not rendered again when unchanged
+        if os.path.exists(doc_path):
+            os.remove(doc_path)
+        start = time.perf_counter()
+        generate_single_docs(api)
+        durations.append(time.perf_counter() - start)
+    return (min(durations), os.path.getsize(doc_path))
+
+
+def main():
+    print(f"{'depth':>6}{'properties':>12}{'size (KB)':>12}{'time (ms)':>12}{'us/property':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for (depth, properties) in [(10, 625), (10, 1250), (10, 2500), (10, 5000), (1, 5000), (5, 5000)]:
+            (duration, size) = _bench(depth, properties, tmp_dir)
+            print(f"{depth:>6}{properties:>12}{size / 1024:>12.0f}{duration * 1000:>12.1f}"
+                  f"{duration / properties * 1e6:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Micro-benchmark for validating the JSON RPC 2.0 envelope of a request.
+
+Compares `jsonschema.validate` with the schema, a cached jsonschema
+validator, and the hand-written `validate_envelope`.
+
+Run from the repository root with:
+
+    python -m benchmarks.envelope
+"""
+import timeit
+
+import jsonschema
+
+from brontosaurus.compile_validators import create_validator, validate
+from brontosaurus.validate_envelope import json_rpc2_schema, validate_envelope
+
+_ENVELOPES = {
+    'valid': {'jsonrpc': '2.0', 'id': 1, 'method': 'echo', 'params': {'message': 'hi'}},
+    'minimal': {'method': 'echo'},
+    'invalid id': {'jsonrpc': '2.0', 'id': {}, 'method': 'echo'},
+    'missing method': {'jsonrpc': '2.0', 'id': 1},
+}
+
+
+def _bench(func, req_json, number):
+    """
+    Return the average number of microseconds per call.
+    """
+    def run():
+        try:
+            func(req_json)
+        except jsonschema.exceptions.ValidationError:
+            pass
+    duration = min(timeit.repeat(run, number=number, repeat=3))
+    return duration / number * 1e6
+
+
+def main(number=20000):
+    validator = create_validator(json_rpc2_schema, {})
+    funcs = {
+        'jsonschema.validate': lambda req_json: jsonschema.validate(req_json, json_rpc2_schema),
+        'cached validator': lambda req_json: validate(validator, req_json),
+        'validate_envelope': validate_envelope,
+    }
+    print(f"{'envelope':<18}" + ''.join(f'{name + " (us)":>26}' for name in funcs))
+    for (name, req_json) in _ENVELOPES.items():
+        timings = [_bench(func, req_json, number) for func in funcs.values()]
+        print(f'{name:<18}' + ''.join(f'{timing:>26.2f}' for timing in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark the built-in JSON codecs on pet shop example requests and responses.
+
+For each codec installed in this environment, measures decoding request
+bodies (single and bulk) and encoding responses (single, bulk, and a single
+response with a large result).
+
+Run from the repository root with:
+
+    python -m benchmarks.json_codec
+"""
+import timeit
+
+from brontosaurus.json_codec import available_codecs, get_json_codec
+
+_PET = {
+    'id': 1,
+    'category': {'id': 1, 'name': 'dogs'},
+    'name': 'Buster',
+    'photoUrls': ['https://spacejam.com/img/p-jamlogo.gif'],
+    'tags': [{'id': 1, 'name': 'good boy'}],
+    'status': 'available',
+}
+_REQUEST = {'jsonrpc': '2.0', 'id': 1, 'method': 'create_order', 'params': {'petId': 1, 'quantity': 2}}
+_RESPONSE = {'jsonrpc': '2.0', 'id': 1, 'result': _PET}
+
+# Payloads to encode, by name
+_RESPONSES = {
+    'single response': _RESPONSE,
+    'bulk (100)': [dict(_RESPONSE, id=idx) for idx in range(100)],
+    'large result (10k)': {'jsonrpc': '2.0', 'id': 1, 'result': [dict(_PET, id=idx) for idx in range(10000)]},
+}
+
+
+def _bench(func, number):
+    """
+    Return the average number of microseconds per call.
+    """
+    duration = min(timeit.repeat(func, number=number, repeat=3))
+    return duration / number * 1e6
+
+
+def main(number=200):
+    codecs = [get_json_codec(name) for name in available_codecs()]
+    stdlib = get_json_codec('json')
+    # Request bodies to decode, by name
+    requests = {
+        'single request': stdlib.dumps(_REQUEST),
+        'bulk request (100)': stdlib.dumps([dict(_REQUEST, id=idx) for idx in range(100)]),
+    }
+    print(f"{'payload':<22}{'op':>8}" + ''.join(f'{codec.name + " (us)":>16}' for codec in codecs))
+    for (name, body) in requests.items():
+        times = [_bench(lambda: codec.loads(body), number) for codec in codecs]
+        _print_row(name, 'loads', times)
+    for (name, value) in _RESPONSES.items():
+        times = [_bench(lambda: codec.dumps(value), number) for codec in codecs]
+        _print_row(name, 'dumps', times)
+
+
+def _print_row(name, op, times):
+    print(f'{name:<22}{op:>8}' + ''.join(f'{time:>16.1f}' for time in times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Load test suite for `python -m brontosaurus.bench`.
+
+Covers single calls, bulk batches of various sizes, a validation-heavy method
+using the schema types from `test/examples/json_schema_types.py`, error
+paths, and subpaths.
+
+Run from the repository root with:
+
+    python -m brontosaurus.bench
+"""
+from brontosaurus import API
+from test.examples import json_schema_types
+
+api = API('Load benchmark', 'Load benchmark API', doc_path=None)
+sub = api.subpath(path='sub', title='Load benchmark subpath', desc='Subpath of the load benchmark API')
+
+for schema in json_schema_types.api.refs.values():
+    api.register(schema)
+
+_TYPES_PARAMS = {
+    'type': 'object',
+    'required': ['email', 'count', 'basic', 'flags', 'items', 'nested'],
+    'additionalProperties': False,
+    'properties': {
+        'email': {'$ref': '#primitive-string'},
+        'count': {'$ref': '#primitive-integer'},
+        'basic': {'$ref': '#obj-basic'},
+        'flags': {'$ref': '#obj-only-additional-props'},
+        'strict': {'$ref': '#obj-no-addl-props'},
+        'items': {'$ref': '#array-items'},
+        'nested': {'$ref': '#obj-array-items-no-additional'},
+        'all_of': {'$ref': '#obj-allOf'},
+        'records': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['name', 'score'],
+                'properties': {
+                    'name': {'type': 'string', 'minLength': 1},
+                    'score': {'type': 'number', 'minimum': 0},
+                    'tags': {'type': 'array', 'items': {'type': 'string'}},
+                },
+            },
+        },
+    },
+}
+
+
+@api.method('echo', 'Echo the message back')
+@api.params({'type': 'object', 'required': ['message'], 'properties': {'message': {'type': 'string'}}})
+def echo(params, headers):
+    return params
+
+
+@api.method('noop', 'Do nothing on the event loop')
+@api.inline
+def noop(params, headers):
+    return None
+
+
+@api.method('types', 'Validate params against many schema types')
+@api.params(_TYPES_PARAMS)
+@api.inline
+def schema_types(params, headers):
+    return len(params['records'])
+
+
+@api.method('fail', 'Raise an exception')
+@api.inline
+def fail(params, headers):
+    raise RuntimeError('Failed on purpose')
+
+
+@sub.method('hello', 'Hello from the subpath')
+@sub.inline
+def sub_hello(params, headers):
+    return 'hello'
+
+
+def _echo(idx):
+    return {'jsonrpc': '2.0', 'id': idx, 'method': 'echo', 'params': {'message': 'hello'}}
+
+
+_TYPES_REQ = {
+    'jsonrpc': '2.0',
+    'id': 1,
+    'method': 'types',
+    'params': {
+        'email': 'someone@example.com',
+        'count': 42,
+        'basic': {'foo': 1, 'bar': [2], 'baz': None},
+        'flags': {'a': True, 'b': False},
+        'strict': {'foo': 1, 'v1': 2},
+        'items': [1, 'two', 3.0],
+        'nested': {'arr': [1, 2, 3]},
+        'all_of': {'foo': True, 'extra': True},
+        'records': [{'name': f'record {idx}', 'score': idx, 'tags': ['a', 'b']} for idx in range(50)],
+    },
+}
+
+SCENARIOS = [
+    {'name': 'single', 'body': _echo(1)},
+    {'name': 'single inline', 'body': {'jsonrpc': '2.0', 'id': 1, 'method': 'noop'}},
+    {'name': 'validation heavy', 'body': _TYPES_REQ},
+    {'name': 'bulk 10', 'body': [_echo(idx) for idx in range(10)]},
+    {'name': 'bulk 100', 'body': [_echo(idx) for idx in range(100)]},
+    {'name': 'bulk 1000', 'body': [_echo(idx) for idx in range(1000)]},
+    {'name': 'error unknown method', 'body': {'jsonrpc': '2.0', 'id': 1, 'method': 'nope'}},
+    {'name': 'error invalid params', 'body': {'jsonrpc': '2.0', 'id': 1, 'method': 'echo', 'params': {'message': 1}}},
+    {'name': 'error handler exception', 'body': {'jsonrpc': '2.0', 'id': 1, 'method': 'fail'}},
+    {'name': 'error invalid json', 'body': b'{"jsonrpc": "2.0", "method": '},
+    {'name': 'subpath', 'path': 'sub', 'body': {'jsonrpc': '2.0', 'id': 1, 'method': 'hello'}},
+]
@@ -0,0 +1,70 @@
+"""
+Benchmark the per-request validation cost for the pet shop example API.
+
+Compares calling `jsonschema.validate` on every request (which checks the
+schema and builds a new validator class each time) with reusing the
+validators compiled by `compile_validators`, and with the generated params
+checks of the 'codegen' validation engine.
+
+Run from the repository root with:
+
+    python -m benchmarks.validators
+"""
+import timeit
+
+import jsonschema
+
+from brontosaurus.compile_validators import compile_validators, validate
+from brontosaurus.generate_validator import generate_validator
+from brontosaurus.validate_envelope import json_rpc2_schema, validate_envelope
+from test.examples.pet_shop import api
+
+# Sample valid params for a few pet shop methods
+_SAMPLE_PARAMS = {
+    'get_pet': {'id': 1},
+    'create_order': {'petId': 1, 'quantity': 2},
+    'get_user': {'username': 'buster'},
+    'find_pet_by_status': {'any_status': ['available', 'sold']},
+    'update_user': {
+        'username_to_update': 'buster',
+        'user': {'firstName': 'Buster', 'email': 'buster@example.com', 'password': 'password123'}
+    },
+}
+
+
+def _bench(func, number):
+    """
+    Return the number of calls per second for a function.
+    """
+    duration = min(timeit.repeat(func, number=number, repeat=3))
+    return number / duration
+
+
+def main(number=2000):
+    compile_validators(api)
+    print(f"{'method':<22}{'before (req/s)':>18}{'after (req/s)':>18}{'codegen (req/s)':>18}{'speedup':>10}")
+    for (meth_name, params) in _SAMPLE_PARAMS.items():
+        meth = api.methods[api.method_names[meth_name]]
+        req_json = {'jsonrpc': '2.0', 'id': 1, 'method': meth_name, 'params': params}
+
+        def before():
+            jsonschema.validate(req_json, json_rpc2_schema)
+            jsonschema.validate(req_json['params'], meth['params_schema'])
+
+        def after():
+            validate_envelope(req_json)
+            validate(meth['params_validator'], req_json['params'])
+        params_check = generate_validator(meth['params_schema'], api.refs)
+
+        def codegen():
+            validate_envelope(req_json)
+            params_check(req_json['params'])
+        before_rate = _bench(before, number)
+        after_rate = _bench(after, number)
+        codegen_rate = _bench(codegen, number)
+        print(f"{meth_name:<22}{before_rate:>18.0f}{after_rate:>18.0f}{codegen_rate:>18.0f}"
+              f"{codegen_rate / before_rate:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
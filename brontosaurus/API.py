@@ -1,8 +1,17 @@
+import asyncio
+import inspect
 import multiprocessing
 import os
+import re
 import brontosaurus.exceptions
-from brontosaurus.create_sanic_server import create_sanic_server
+from brontosaurus.compile_dispatch import compile_dispatch
+from brontosaurus.compile_validators import compile_validators
+from brontosaurus.create_sanic_server import StreamingProtocol, create_sanic_server
 from brontosaurus.generate_docs import generate_docs
+from brontosaurus.json_codec import get_json_codec
+from brontosaurus.log_pipeline import LogPipeline
+from brontosaurus.process_pool import ProcessPool
+from brontosaurus.result_cache import ResultCache
 from brontosaurus.utils.find_keys import find_keys
 
 
@@ -11,13 +20,20 @@ class API:
     Class for a brontosaurus API object.
     """
 
-    def __init__(self, title, desc, doc_path='API.md'):
+    def __init__(self, title, desc, doc_path='API.md', max_batch_size=None, max_batch_concurrency=None,
+                 stream_bulk=False):
         """
         Create a new JSON RPC + JSON Schema API.
         """
         self.title = title
         self.desc = desc
         self.doc_path = doc_path
+        # Maximum number of items allowed in a bulk request
+        self.max_batch_size = max_batch_size
+        # Maximum number of items of a single bulk request that run at once
+        self.max_batch_concurrency = max_batch_concurrency
+        # Always stream bulk responses as newline-delimited JSON, in completion order
+        self.stream_bulk = stream_bulk
         # Map function IDs to name, summary, func, params, result
         self.methods = {}  # type: dict
         # Map method name to function IDs
@@ -31,7 +47,9 @@ class API:
 
     def method(self, name, summary):
         """
-        Register a new RPC method.
+        Register a new RPC method. The handler may be a regular function or an
+        `async def` coroutine function, which is awaited on the event loop.
+        Handlers that return a sync or async generator have their result streamed.
         """
         if name in self.methods:
             raise brontosaurus.exceptions.MethodAlreadyExists(f"Method already registered: {name}")
@@ -43,6 +61,8 @@ class API:
             self.methods[_id]['name'] = name
             self.methods[_id]['summary'] = summary
             self.methods[_id]['func'] = func
+            self.methods[_id]['is_async'] = asyncio.iscoroutinefunction(func)
+            self.methods[_id]['is_generator'] = inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func)
             self.method_names[name] = _id
             return func
         return wrapper
@@ -89,17 +109,22 @@ class API:
             return func
         return wrapper
 
-    def result(self, schema):
+    def result(self, schema, validation_rate=None):
         """
-        Define a JSON schema for the RPC result for a method.
+        Define a JSON schema for the RPC result for a method. In production,
+        `validation_rate` overrides the `result_validation_rate` of `run` for
+        this method.
         """
         self._get_ref(schema)
+        _check_rate(validation_rate)
 
         def wrapper(func):
             _id = id(func)
             if _id not in self.methods:
                 self.methods[_id] = {}
             self.methods[_id]['result_schema'] = schema
+            if validation_rate is not None:
+                self.methods[_id]['result_validation_rate'] = validation_rate
             self._save_method_using(schema, _id)
             return func
         return wrapper
@@ -107,18 +132,91 @@ class API:
     def require_header(self, key, pattern=None):
         """
         Require an HTTP(S) header with an optionally enforced string or regex
-        pattern for the value.
+        pattern for the value. Header names are case-insensitive.
         """
+        # Compile the pattern once, rather than on every request
+        regex = re.compile(pattern) if pattern is not None else None
+
         def wrapper(func):
             _id = id(func)
             if _id not in self.methods:
                 self.methods[_id] = {}
             if 'headers' not in self.methods[_id]:
                 self.methods[_id]['headers'] = []
-            self.methods[_id]['headers'].append((key, pattern))
+            self.methods[_id]['headers'].append((key, regex))
+            return func
+        return wrapper
+
+    def inline(self, func):
+        """
+        Run a synchronous method handler directly on the event loop instead of
+        in the thread pool. Only useful for trivially cheap handlers, where
+        handing off to a thread costs more than the handler itself.
+        """
+        _id = id(func)
+        if _id not in self.methods:
+            self.methods[_id] = {}
+        self.methods[_id]['inline'] = True
+        return func
+
+    def cpu_bound(self, func):
+        """
+        Run a method handler in a pool of processes instead of a thread, so
+        that CPU-heavy handlers can use multiple cores. The params, headers
+        and result get pickled across the process boundary, so the handler
+        must be a module-level function.
+        """
+        if asyncio.iscoroutinefunction(func):
+            raise TypeError(f"CPU-bound handler '{func.__qualname__}' cannot be an async function")
+        if '<' in func.__qualname__:
+            raise TypeError(f"CPU-bound handler '{func.__qualname__}' must be a module-level function")
+        _id = id(func)
+        if _id not in self.methods:
+            self.methods[_id] = {}
+        self.methods[_id]['cpu_bound'] = True
+        return func
+
+    def cache(self, maxsize=128, ttl=None, headers=()):
+        """
+        Cache the results of a method, keyed on its validated params and the
+        values of the given header names. Entries are evicted in least
+        recently used order, and expire after `ttl` seconds if set.
+        """
+        def wrapper(func):
+            _check_not_generator(func, 'cached')
+            _id = id(func)
+            if _id not in self.methods:
+                self.methods[_id] = {}
+            self.methods[_id]['cache'] = ResultCache(maxsize, ttl, headers)
+            return func
+        return wrapper
+
+    def coalesce(self, headers=()):
+        """
+        Share one execution of a method between all identical calls that are
+        in flight at the same time, where identical means the same subpath,
+        method, params and values of the given header names.
+        """
+        def wrapper(func):
+            _check_not_generator(func, 'coalesced')
+            _id = id(func)
+            if _id not in self.methods:
+                self.methods[_id] = {}
+            self.methods[_id]['coalesce'] = tuple(headers)
             return func
         return wrapper
 
+    def cache_info(self, name):
+        """
+        Get the hit and miss counts and the size of a method's result cache
+        in the current worker process. Call it from a handler; the counts
+        of all the workers are in the metrics.
+        """
+        meth = self.methods[self.method_names[name]]
+        if 'cache' not in meth:
+            raise ValueError(f"Method '{name}' is not cached")
+        return meth['cache'].info()
+
     def deprecated(self, reason):
         """
         Mark a method as deprecated with a reason.
@@ -131,7 +229,8 @@ class API:
             return func
         return wrapper
 
-    def subpath(self, path, title, desc, doc_path=None):
+    def subpath(self, path, title, desc, doc_path=None, max_batch_size=None, max_batch_concurrency=None,
+                stream_bulk=False):
         """
         Create a nested API under a subpath.
         """
@@ -141,20 +240,60 @@ class API:
             path = path[1:]
         if doc_path is None:
             doc_path = path.replace('/', '-') + '.md'
-        subapi = API(title, desc, doc_path)
+        subapi = API(title, desc, doc_path, max_batch_size, max_batch_concurrency, stream_bulk)
         self.subpaths[path] = subapi
         return subapi
 
-    def run(self, host='0.0.0.0', port=8080, development=True, cors=False, workers=2):
+    def run(self, host='0.0.0.0', port=8080, development=True, cors=False, workers=2,
+            validation_engine='jsonschema', threads=None, max_bulk_in_flight=None, processes=None,
+            stream_requests=False, json_codec='auto', metrics_path=None,
+            server_timing_token=None, log_path=None, log_max_bytes=1048576, log_backup_count=3,
+            log_buffer_size=10000, result_validation_rate=0.0):
         """
         Run the server.
         """
         if not workers:
             workers = multiprocessing.cpu_count()
+        _check_rate(result_validation_rate)
+        json_codec = get_json_codec(json_codec)
         if development:
             generate_docs(self)
             # Print log messages immediately without buffering them (slower)
             os.environ['PYTHONUNBUFFERED'] = '1'
             print('Running in development mode')  # TODO
-        app = create_sanic_server(self, workers, cors, development)
-        app.run(host=host, port=port, workers=workers, access_log=development)
+        # Check and compile all schemas and methods once, before any workers are started
+        compile_validators(self, validation_engine)
+        dispatch = compile_dispatch(self)
+        # All the workers send their log records to a single writer in this process
+        log_pipeline = LogPipeline(development, log_path, log_max_bytes, log_backup_count, log_buffer_size)
+        log_pipeline.start()
+        process_pool = None
+        if any(meth.cpu_bound for meth in dispatch.methods.values()):
+            process_pool = ProcessPool(processes, workers)
+        try:
+            app = create_sanic_server(self, workers, cors, development, threads=threads,
+                                      max_bulk_in_flight=max_bulk_in_flight, processes=processes,
+                                      stream_requests=stream_requests, json_codec=json_codec, dispatch=dispatch,
+                                      metrics_path=metrics_path, server_timing_token=server_timing_token,
+                                      log_pipeline=log_pipeline, result_validation_rate=result_validation_rate,
+                                      process_pool=process_pool)
+            # Streamed request bodies need a fix to Sanic's protocol
+            protocol = StreamingProtocol if stream_requests else None
+            app.run(host=host, port=port, workers=workers, access_log=development, protocol=protocol)
+        finally:
+            if process_pool:
+                process_pool.stop()
+            log_pipeline.stop()
+
+
+def _check_rate(rate):
+    if rate is not None and not 0 <= rate <= 1:
+        raise ValueError(f"Result validation rate must be between 0 and 1, not {rate}")
+
+
+def _check_not_generator(func, action):
+    """
+    Streamed results can only be consumed once, so they can't be shared.
+    """
+    if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+        raise TypeError(f"Results of generator handler '{func.__qualname__}' cannot be {action}")
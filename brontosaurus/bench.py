@@ -0,0 +1,259 @@
+"""
+HTTP load generator for benchmarking a brontosaurus server.
+
+Starts the API of a benchmark suite on a local port (or targets an already
+running server with `--url`), drives it with concurrent keep-alive
+connections for each scenario of the suite, and prints the throughput and
+latency percentiles of every scenario as JSON, so that results can be
+compared between runs.
+
+A suite is a module with an `api` object and a `SCENARIOS` list. Each
+scenario is a dict with a `name`, the `path` to post to, and the request
+`body`, which is encoded as JSON unless it is already bytes. Run the suite
+in `benchmarks/load.py` from the repository root with:
+
+    python -m brontosaurus.bench
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import multiprocessing
+import platform
+import socket
+import sys
+import time
+import urllib.parse
+
+DEFAULT_SUITE = 'benchmarks.load'
+
+
+class HTTPConnection:
+    """
+    Minimal keep-alive HTTP/1.1 client connection for posting JSON bodies.
+    Only supports what the load generator needs, so that it doesn't depend on
+    any HTTP client library or add its overhead to the measurements.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def post(self, path, body):
+        """
+        Post an encoded JSON body, returning the status code and response body in a pair.
+        """
+        if self.writer is None:
+            (self.reader, self.writer) = await asyncio.open_connection(self.host, self.port)
+        head = (
+            f'POST {path} HTTP/1.1\r\n'
+            f'Host: {self.host}:{self.port}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n'
+        )
+        self.writer.write(head.encode() + body)
+        try:
+            (status, headers) = await self._read_head()
+            if headers.get('transfer-encoding') == 'chunked':
+                resp_body = await self._read_chunked()
+            else:
+                resp_body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        except BaseException:
+            # The connection is in an unknown state, so start over with a new one
+            self.close()
+            raise
+        if headers.get('connection') == 'close':
+            self.close()
+        return (status, resp_body)
+
+    async def _read_head(self):
+        lines = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ', 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                (key, _, value) = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+        return (status, headers)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            # Each chunk, including the last empty one, ends with a CRLF
+            chunk = await self.reader.readexactly(size + 2)
+            if not size:
+                return b''.join(chunks)
+            chunks.append(chunk[:-2])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        (self.reader, self.writer) = (None, None)
+
+
+async def run_scenario(host, port, path, body, requests, concurrency):
+    """
+    Post `body` to `path` `requests` times over `concurrency` connections.
+    Returns the latencies of all the requests in seconds, the count of each
+    response status (with 0 for failed connections), and the total duration,
+    in a tuple.
+    """
+    latencies = []  # type: list
+    statuses = {}  # type: dict
+    remaining = [requests]
+
+    async def worker():
+        conn = HTTPConnection(host, port)
+        try:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                try:
+                    (status, _) = await conn.post(path, body)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    status = 0
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(min(concurrency, requests))])
+    return (latencies, statuses, time.perf_counter() - start)
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a sorted list of values.
+    """
+    if not values:
+        return None
+    # Round off float error, so that the 99.9th of 1000 values is the 999th
+    rank = math.ceil(round(pct * len(values) / 100, 6))
+    return values[max(rank, 1) - 1]
+
+
+def summarize(latencies, statuses, duration, items=1):
+    """
+    Throughput and latency statistics for a scenario, with latencies in milliseconds.
+    """
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def millis(seconds):
+        return None if seconds is None else round(seconds * 1000, 3)
+    return {
+        'requests': count,
+        'items_per_request': items,
+        'statuses': {str(status): num for (status, num) in sorted(statuses.items())},
+        'duration_s': round(duration, 3),
+        'requests_per_s': round(count / duration, 1) if duration else None,
+        'items_per_s': round(count * items / duration, 1) if duration else None,
+        'latency_ms': {
+            'mean': millis(sum(latencies) / count if count else None),
+            'p50': millis(percentile(latencies, 50)),
+            'p99': millis(percentile(latencies, 99)),
+            'p999': millis(percentile(latencies, 99.9)),
+            'max': millis(latencies[-1] if latencies else None),
+        },
+    }
+
+
+async def run_suite(host, port, scenarios, requests, concurrency, warmup=0):
+    """
+    Run each scenario in turn, returning a list of their summaries.
+    """
+    results = []
+    for scenario in scenarios:
+        body = scenario['body']
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        path = '/' + scenario.get('path', '').lstrip('/')
+        if warmup:
+            await run_scenario(host, port, path, body, warmup, concurrency)
+        (latencies, statuses, duration) = await run_scenario(host, port, path, body, requests, concurrency)
+        items = len(scenario['body']) if isinstance(scenario['body'], list) else 1
+        results.append(dict(name=scenario['name'], **summarize(latencies, statuses, duration, items)))
+    return results
+
+
+def start_server(api, host, port, **run_kwargs):
+    """
+    Run an API in a child process in production mode, waiting until it
+    accepts connections. Returns the process.
+    """
+    run_kwargs.setdefault('development', False)
+    # Not a daemon, as the server starts its own worker processes
+    proc = multiprocessing.Process(target=api.run, kwargs=dict(run_kwargs, host=host, port=port))
+    proc.start()
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return proc
+        except OSError:
+            if not proc.is_alive() or time.monotonic() > deadline:
+                proc.terminate()
+                raise RuntimeError(f'Server for the benchmark did not start on port {port}')
+            time.sleep(0.1)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m brontosaurus.bench', description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--suite', default=DEFAULT_SUITE,
+                        help='Module with the `api` to run and its `SCENARIOS` (default: %(default)s)')
+    parser.add_argument('--url', help='Benchmark an already running server instead of starting the suite API')
+    parser.add_argument('--port', type=int, default=8181, help='Port to run the suite API on (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=1, help='Server worker processes (default: %(default)s)')
+    parser.add_argument('--json-codec', default='auto', help='JSON codec of the server (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent connections (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=100, help='Untimed requests per scenario (default: %(default)s)')
+    parser.add_argument('--only', action='append', help='Only run scenarios whose name contains this (repeatable)')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    suite = importlib.import_module(args.suite)
+    scenarios = [
+        scenario for scenario in suite.SCENARIOS
+        if not args.only or any(name in scenario['name'] for name in args.only)
+    ]
+    proc = None
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        (host, port) = (url.hostname, url.port or 80)
+    else:
+        (host, port) = ('127.0.0.1', args.port)
+        proc = start_server(suite.api, host, port, workers=args.workers, json_codec=args.json_codec)
+    try:
+        results = asyncio.run(run_suite(host, port, scenarios, args.requests, args.concurrency, args.warmup))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.join()
+    report = {
+        'suite': args.suite,
+        'url': args.url or f'http://{host}:{port}',
+        'workers': None if args.url else args.workers,
+        'json_codec': None if args.url else args.json_codec,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'python': platform.python_version(),
+        'scenarios': results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            fd.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,138 @@
+"""
+Compile the `default` keywords of a JSON Schema into a plan for filling in
+missing values.
+
+A plan is built once per schema at startup, with `$ref`s to registered types
+resolved and any parts of the schema without defaults left out, so applying
+it only visits the parts of an instance where a default can apply. Defaults
+are filled in place, in a single pass, without copying the instance.
+
+Defaults are applied for `properties` (including nested objects), the
+`items` of arrays, `$ref`s and `allOf`. Schemas under `anyOf`, `oneOf`,
+`if`/`then`/`else`, `additionalProperties` and tuple `items` are skipped, as
+it isn't known in advance whether they apply to a value.
+"""
+import copy
+
+
+class _Plan:
+    """
+    How to fill in the defaults of a value for one schema.
+    """
+
+    __slots__ = (
+        # Tuple of (key, default, is_mutable) for properties with a default
+        'defaults',
+        # Tuple of (key, plan) for properties whose values have defaults of their own
+        'properties',
+        # Plan for every item of an array, or None
+        'items',
+        # Tuple of plans for the same value, from `allOf`
+        'all_of',
+    )
+
+    def __init__(self):
+        self.defaults = ()
+        self.properties = ()
+        self.items = None
+        self.all_of = ()
+
+
+def compile_defaults(schema, refs):
+    """
+    Create a plan for filling in the defaults of a schema, resolving `#id`
+    references with the registered `refs`. Returns None if there are no
+    defaults that could apply.
+    """
+    plans = {}  # type: dict
+    plan = _compile(schema, schema, refs, plans)
+    useful = _useful_plans(plans.values())
+    for each in plans.values():
+        each.properties = tuple((key, child) for (key, child) in each.properties if id(child) in useful)
+        each.items = each.items if each.items is not None and id(each.items) in useful else None
+        each.all_of = tuple(child for child in each.all_of if id(child) in useful)
+    return plan if id(plan) in useful else None
+
+
+def apply_defaults(plan, instance):
+    """
+    Fill in missing values of an instance that has already been validated, in place.
+    """
+    if isinstance(instance, dict):
+        for (key, default, is_mutable) in plan.defaults:
+            if key not in instance:
+                # Every instance gets its own copy of a mutable default
+                instance[key] = copy.deepcopy(default) if is_mutable else default
+        for (key, child) in plan.properties:
+            if key in instance:
+                apply_defaults(child, instance[key])
+    elif isinstance(instance, list) and plan.items is not None:
+        for item in instance:
+            apply_defaults(plan.items, item)
+    for child in plan.all_of:
+        apply_defaults(child, instance)
+
+
+def _compile(schema, root, refs, plans):
+    """
+    Build the plan for a schema, reusing the plan of any schema that was
+    already seen, so that recursive references terminate.
+    """
+    schema = _resolve(schema, root, refs)
+    if not isinstance(schema, dict):
+        return _Plan()
+    if id(schema) in plans:
+        return plans[id(schema)]
+    plan = _Plan()
+    plans[id(schema)] = plan
+    (defaults, properties) = ([], [])
+    for (key, prop) in schema.get('properties', {}).items():
+        # A property referring to a type gets the default of that type
+        prop = _resolve(prop, root, refs)
+        if isinstance(prop, dict) and 'default' in prop:
+            default = prop['default']
+            defaults.append((key, default, isinstance(default, (dict, list))))
+        properties.append((key, _compile(prop, root, refs, plans)))
+    plan.defaults = tuple(defaults)
+    plan.properties = tuple(properties)
+    if isinstance(schema.get('items'), dict):
+        plan.items = _compile(schema['items'], root, refs, plans)
+    plan.all_of = tuple(_compile(sub, root, refs, plans) for sub in schema.get('allOf', ()))
+    return plan
+
+
+def _resolve(schema, root, refs):
+    """
+    Follow the `$ref`s of a schema to the schema they refer to, which is None
+    if a reference can't be resolved. Other keywords next to a `$ref` are
+    ignored, as in draft 7.
+    """
+    seen = set()
+    while isinstance(schema, dict) and '$ref' in schema:
+        if id(schema) in seen:
+            return None
+        seen.add(id(schema))
+        ref = schema['$ref']
+        schema = root if ref == '#' else refs.get(ref)
+    return schema
+
+
+def _useful_plans(plans):
+    """
+    Find the ids of the plans that have defaults, or that lead to one that does.
+    """
+    plans = list(plans)
+    useful = {id(plan) for plan in plans if plan.defaults}
+    changed = True
+    while changed:
+        changed = False
+        for plan in plans:
+            if id(plan) in useful:
+                continue
+            children = [child for (_, child) in plan.properties] + list(plan.all_of)
+            if plan.items is not None:
+                children.append(plan.items)
+            if any(id(child) in useful for child in children):
+                useful.add(id(plan))
+                changed = True
+    return useful
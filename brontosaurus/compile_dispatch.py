@@ -0,0 +1,92 @@
+"""
+Compile the methods of an API object and its subpaths into a single dispatch
+table, so that handling a request takes one dict lookup to find everything
+needed to run a method.
+
+The table is built once in `API.run`, after the validators are compiled and
+before any server workers are started.
+"""
+import types
+
+
+class MethodRecord:
+    """
+    Everything needed to handle calls to one method.
+    """
+
+    __slots__ = (
+        # Position of the method in the dispatch table, for per-method arrays
+        'index',
+        'name',
+        'func',
+        # Compiled validators, or None if the method has no such schema
+        'params_validator',
+        'params_check',
+        'result_validator',
+        'result_items_validator',
+        # Plans for filling in schema defaults, or None if there are none
+        'params_defaults',
+        'result_defaults',
+        # Fraction of results to validate in production, or None for the server default
+        'result_validation_rate',
+        # Tuple of (header name, compiled regex or None) pairs
+        'headers',
+        'is_async',
+        'is_generator',
+        'inline',
+        'cpu_bound',
+        # ResultCache object, or None
+        'cache',
+        # Tuple of header names to coalesce calls on, or None
+        'coalesce',
+    )
+
+    def __init__(self, meth, index=0):
+        self.index = index
+        self.name = meth['name']
+        self.func = meth['func']
+        self.params_validator = meth.get('params_validator')
+        self.params_check = meth.get('params_check')
+        self.result_validator = meth.get('result_validator')
+        self.result_items_validator = meth.get('result_items_validator')
+        self.params_defaults = meth.get('params_defaults')
+        self.result_defaults = meth.get('result_defaults')
+        self.result_validation_rate = meth.get('result_validation_rate')
+        self.headers = tuple(meth.get('headers', ()))
+        self.is_async = meth.get('is_async', False)
+        self.is_generator = meth.get('is_generator', False)
+        self.inline = meth.get('inline', False)
+        self.cpu_bound = meth.get('cpu_bound', False)
+        self.cache = meth.get('cache')
+        self.coalesce = meth.get('coalesce')
+
+    def __repr__(self):
+        return f'MethodRecord({self.name!r})'
+
+
+class DispatchTable:
+    """
+    Read-only mappings of `(subpath, method name)` pairs to method records,
+    and of subpaths to their API objects. The root API has a subpath of None.
+    """
+
+    __slots__ = ('methods', 'apis')
+
+    def __init__(self, methods, apis):
+        self.methods = types.MappingProxyType(methods)
+        self.apis = types.MappingProxyType(apis)
+
+
+def compile_dispatch(api):
+    """
+    Create the dispatch table for the root API and all of its subpaths.
+    Validators must already have been compiled with `compile_validators`.
+    """
+    apis = {None: api}
+    for (path, sub_api) in api.subpaths.items():
+        apis[path] = sub_api
+    methods = {}
+    for (path, api_handler) in apis.items():
+        for (name, meth_id) in api_handler.method_names.items():
+            methods[(path, name)] = MethodRecord(api_handler.methods[meth_id], len(methods))
+    return DispatchTable(methods, apis)
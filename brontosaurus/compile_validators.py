@@ -0,0 +1,89 @@
+"""
+Build JSON Schema validators for the methods of an API object.
+
+Validators are created once at startup, so each schema is only checked
+against its meta-schema a single time and every request reuses the same
+validator object.
+"""
+import jsonschema
+import jsonschema.exceptions
+import jsonschema.validators
+
+from brontosaurus.compile_defaults import compile_defaults
+from brontosaurus.generate_validator import generate_validator
+
+# Available engines for validating method params
+ENGINES = ('jsonschema', 'codegen')
+
+
+def compile_validators(api, engine='jsonschema'):
+    """
+    Compile validators for the root API and all of its subpaths.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown validation engine '{engine}'. Use one of: {', '.join(ENGINES)}")
+    compile_single_validators(api, engine)
+    for (_, sub_api) in api.subpaths.items():
+        compile_single_validators(sub_api, engine)
+
+
+def compile_single_validators(api, engine='jsonschema'):
+    """
+    Set the 'params_validator' and 'result_validator' entries for every method
+    in an API object that has a params or result schema, and the
+    'params_defaults' and 'result_defaults' plans for schemas with defaults.
+    With the 'codegen' engine, also set a generated 'params_check' function
+    for each params schema that can be compiled to Python.
+    """
+    for (_id, schema) in api.refs.items():
+        jsonschema.validators.validator_for(schema).check_schema(schema)
+    for (_id, meth) in api.methods.items():
+        if 'params_schema' in meth:
+            meth['params_validator'] = create_validator(meth['params_schema'], api.refs)
+            meth['params_defaults'] = compile_defaults(meth['params_schema'], api.refs)
+            if engine == 'codegen':
+                meth['params_check'] = generate_validator(meth['params_schema'], api.refs)
+        if 'result_schema' in meth:
+            meth['result_validator'] = create_validator(meth['result_schema'], api.refs)
+            meth['result_defaults'] = compile_defaults(meth['result_schema'], api.refs)
+            # Streamed results are validated item by item
+            items_schema = meth['result_schema'].get('items')
+            if isinstance(items_schema, (dict, bool)):
+                meth['result_items_validator'] = create_validator(items_schema, api.refs)
+
+
+def create_validator(schema, refs):
+    """
+    Check a schema and create a reusable validator object for it.
+    References in the form of `#id` are resolved using the registered `refs`.
+    """
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    resolver = _RefResolver(refs, base_uri=cls.ID_OF(schema), referrer=schema)
+    return cls(schema, resolver=resolver)
+
+
+def validate(validator, instance):
+    """
+    Validate an instance using a compiled validator.
+    Raises the same error that `jsonschema.validate` would raise.
+    """
+    error = jsonschema.exceptions.best_match(validator.iter_errors(instance))
+    if error is not None:
+        raise error
+
+
+class _RefResolver(jsonschema.RefResolver):
+    """
+    Reference resolver that looks up `#id` references in an API's registered
+    schemas before falling back to the default resolution.
+    """
+
+    def __init__(self, refs, *args, **kwargs):
+        self.refs = refs
+        super().__init__(*args, **kwargs)
+
+    def resolve(self, ref):
+        if ref in self.refs:
+            return (ref, self.refs[ref])
+        return super().resolve(ref)
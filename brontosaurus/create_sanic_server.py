@@ -1,122 +1,127 @@
 """
 Generate the sanic server object from a brontosaurus API object.
 """
+import asyncio
+import concurrent.futures
+import hmac
+import random
 import sanic
 from sanic.log import error_logger
+from sanic.server import HttpProtocol
 import jsonschema.exceptions
+import time
 import traceback
-import threading
-import multiprocessing
-import re
-import sys
-import os
-
-
-def _init_log_config(development, log_path):
-    level = "DEBUG" if development else "WARNING"
-    return {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'loggers': {
-            "sanic.root": {
-                "level": level,
-                "handlers": ["console", "rot_file"]
-            },
-            "sanic.error": {
-                "level": level,
-                "handlers": ["error_console", "rot_file"],
-                "propagate": True,
-                "qualname": "sanic.error",
-            },
-            "sanic.access": {
-                "level": level,
-                "handlers": ["access_console", "rot_file_access"],
-                "propagate": True,
-                "qualname": "sanic.access",
-            },
-        },
-        'handlers': {
-            "rot_file": {
-                "class": "logging.handlers.RotatingFileHandler",
-                "formatter": "generic",
-                "filename": log_path,
-                "maxBytes": 1048576,
-                "backupCount": 3
-            },
-            "rot_file_access": {
-                "class": "logging.handlers.RotatingFileHandler",
-                "formatter": "access",
-                "filename": log_path,
-                "maxBytes": 1048576,
-                "backupCount": 3
-            },
-            "console": {
-                "class": "logging.StreamHandler",
-                "formatter": "generic",
-                "stream": sys.stdout,
-            },
-            "error_console": {
-                "class": "logging.StreamHandler",
-                "formatter": "generic",
-                "stream": sys.stderr,
-            },
-            "access_console": {
-                "class": "logging.StreamHandler",
-                "formatter": "access",
-                "stream": sys.stdout,
-            },
-        },
-        'formatters': {
-            "generic": {
-                "format": "%(asctime)s %(levelname)-8s %(message)s",
-                "datefmt": "%Y-%m-%d %H:%M:%S",
-                "class": "logging.Formatter",
-            },
-            "access": {
-                "format": "%(asctime)s %(levelname)-8s %(host)s %(request)s %(message)s-> %(status)d",
-                "datefmt": "%Y-%m-%d %H:%M:%S",
-                "class": "logging.Formatter",
-            },
-        },
-    }
-
-
-def create_sanic_server(api, workers, cors, development, log_path=None):
-    if not log_path:
-        log_path = os.path.join('tmp', 'app.log')
-        os.makedirs('tmp', exist_ok=True)
-    app = sanic.Sanic(strict_slashes=False, log_config=_init_log_config(development, log_path))
+import types
+
+from brontosaurus.compile_defaults import apply_defaults
+from brontosaurus.compile_dispatch import compile_dispatch
+from brontosaurus.compile_validators import validate
+from brontosaurus.json_codec import get_json_codec
+from brontosaurus.log_pipeline import LogPipeline
+from brontosaurus.metrics import Metrics
+from brontosaurus.parse_json_array import JSONArrayParser
+from brontosaurus.process_pool import ProcessPool
+from brontosaurus.result_cache import MISSING, make_key
+from brontosaurus.result_stream import ResultStream, is_stream
+from brontosaurus.server_timing import NO_TIMER, PhaseTimer, format_timings, start_timer
+from brontosaurus.validate_envelope import validate_envelope
+
+
+def create_sanic_server(api, workers, cors, development, log_path=None, threads=None, max_bulk_in_flight=None,
+                        processes=None, stream_requests=False, json_codec=None, dispatch=None, metrics_path=None,
+                        server_timing_token=None, log_pipeline=None, result_validation_rate=0.0,
+                        process_pool=None):
+    if log_pipeline is None:
+        log_pipeline = LogPipeline(development, log_path)
+        log_pipeline.start()
+    app = sanic.Sanic(strict_slashes=False, log_config=log_pipeline.log_config())
     methods = ['OPTIONS', 'PUT', 'POST', 'GET', 'DELETE']
-
-    @app.route("/", methods=methods)
-    @app.route("/<subpath:path>", methods=methods)
-    def root(req, subpath=None):
+    # Settings and per-worker resources used when handling requests
+    server = {
+        # Dispatch table of all methods, built before the workers are started
+        'dispatch': dispatch or compile_dispatch(api),
+        'development': development,
+        'executor': None,
+        'process_pool': None,
+        'bulk_semaphore': None,
+        # Map keys of coalesced calls to the shared future of their result
+        'in_flight': {},
+        'json_codec': json_codec or get_json_codec(),
+        # Encoded error objects that don't depend on the request
+        'error_cache': {},
+        # Per-method counters shared by all the workers, if metrics are enabled
+        'metrics': None,
+        # Clients sending this token get Server-Timing headers in production
+        'server_timing_token': server_timing_token,
+        # Fraction of results to validate in production, for methods without their own rate
+        'result_validation_rate': result_validation_rate,
+    }
+    if process_pool is None and any(meth.cpu_bound for meth in server['dispatch'].methods.values()):
+        process_pool = ProcessPool(processes, workers)
+    if process_pool:
+        # CPU-bound handlers run in a pool of processes, so they are not limited by the GIL.
+        # The workers can't start processes themselves, so the pool is started before they are forked.
+        process_pool.start()
+        server['process_pool'] = process_pool
+    if metrics_path:
+        # Allocated before the workers get forked, so that they all share it
+        server['metrics'] = Metrics(server['dispatch'], workers)
+
+    @app.listener('before_server_start')
+    async def start_executor(app, loop):
+        # Each worker process gets its own thread pool for synchronous handlers
+        server['executor'] = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        if server['process_pool']:
+            server['process_pool'].start_worker(loop)
+        # Cap the bulk request items in flight across all requests on this worker
+        if max_bulk_in_flight:
+            server['bulk_semaphore'] = asyncio.Semaphore(max_bulk_in_flight)
+        if server['metrics']:
+            server['metrics'].start_worker()
+
+    @app.listener('after_server_stop')
+    async def stop_executor(app, loop):
+        server['executor'].shutdown(wait=False)
+        if server['process_pool']:
+            server['process_pool'].stop_worker()
+
+    if metrics_path:
+        # Serve the metrics of all the workers in the Prometheus text format
+        @app.route('/' + metrics_path.lstrip('/'), methods=['GET'])
+        async def metrics(req):
+            return sanic.response.text(server['metrics'].render(), content_type=_METRICS_TYPE)
+
+    @app.route("/", methods=methods, stream=stream_requests)
+    @app.route("/<subpath:path>", methods=methods, stream=stream_requests)
+    async def root(req, subpath=None):
         if req.method == 'OPTIONS':
             return sanic.response.raw(b'')
+        # One read-only view of the headers is shared by all the items of a bulk request
+        headers = types.MappingProxyType(req.headers)
+        if not _wants_timings(server, headers):
+            return await handle(req, headers, subpath, NO_TIMER)
+        timer = PhaseTimer({})
+        resp = await handle(req, headers, subpath, timer)
+        timer.timings['total'] = time.perf_counter() - timer.start
+        resp.headers['Server-Timing'] = format_timings(timer.timings)
+        return resp
+
+    async def handle(req, headers, subpath, timer):
+        if stream_requests:
+            return await _handle_streamed_req(server, req, headers, subpath, timer.timings)
         try:
-            req_json = req.json
+            req_json = req.load_json(loads=server['json_codec'].loads)
         except sanic.exceptions.InvalidUsage as err:
-            return sanic.response.json(_invalid_json_resp(req, err), 400)
+            return _json_resp(_error_body(server, None, server['json_codec'].dumps(_invalid_json_err(err))), 400)
+        timer.lap('parse')
         if isinstance(req_json, list):
             # Handle a bulk request
-            responses = []
-            threads = []
-            resp_queue = multiprocessing.Queue()
-            for each in req_json:
-                args = (api, req, each, development, resp_queue, subpath)
-                thread = threading.Thread(target=_handle_root_resp_async, args=args, daemon=True)
-                thread.start()
-                threads.append(thread)
-            for thread in threads:
-                thread.join()
-            while resp_queue.qsize():
-                resp = resp_queue.get()
-                responses.append(resp)
-            return sanic.response.json(responses, 200)
+            if _wants_ndjson(server, headers, subpath):
+                return _ndjson_bulk_resp(server, headers, req_json, subpath)
+            (body, code) = await _handle_bulk_resp(server, headers, req_json, subpath, timer.timings)
+            return _json_resp(body, code)
         else:
-            # Handle a single request
-            (resp, code) = _handle_root_resp(api, req, req_json, development, subpath)
-            return sanic.response.json(resp, code)
+            return await _handle_single_req(server, headers, req_json, subpath, timer.timings)
 
     # Handle an OPTIONS request
     @app.middleware('request')
@@ -145,143 +150,701 @@ def create_sanic_server(api, workers, cors, development, log_path=None):
     return app
 
 
-def _handle_root_resp(api, req, req_json, development, path):
+class StreamingProtocol(HttpProtocol):
+    """
+    Sanic's HTTP protocol, keeping the chunks of streamed request bodies in order.
+
+    Sanic puts each chunk on the request's queue from a task of its own. Once
+    the queue is full, the tasks waiting for room get overtaken by new ones,
+    which jumbles the body. Chunks are put on a _ChunkBuffer as they arrive
+    instead, which pauses reading from the connection while the handler is
+    behind.
+    """
+
+    def on_headers_complete(self):
+        super().on_headers_complete()
+        # The handler task has been created, but hasn't run yet
+        if self.is_request_stream and self._is_stream_handler:
+            self.request.stream = _ChunkBuffer(self.transport)
+
+    def on_body(self, body):
+        if self.is_request_stream and self._is_stream_handler:
+            self.request.stream.put_nowait(body)
+        else:
+            self.request.body_push(body)
+
+
+# Pause reading a streamed request body while this many chunks are waiting
+# for the handler, and resume once it has caught up with half of them
+_MAX_QUEUED_CHUNKS = 16
+
+
+class _ChunkBuffer:
     """
-    Returns the JSON body of the response and the HTTP status code in a pair.
+    The chunks of a streamed request body that the handler has yet to read,
+    ending with None. Reading from the connection is paused while
+    _MAX_QUEUED_CHUNKS chunks are waiting, and resumed by `read`.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.queue = asyncio.Queue()
+        self.paused = False
+        self.closed = False
+
+    def put_nowait(self, chunk):
+        if self.closed:
+            return
+        self.queue.put_nowait(chunk)
+        if not self.paused and self.queue.qsize() >= _MAX_QUEUED_CHUNKS:
+            self.paused = True
+            self.transport.pause_reading()
+
+    async def put(self, chunk):
+        # Sanic puts the final None from a task, after all of the chunks
+        self.put_nowait(chunk)
+
+    async def read(self):
+        chunk = await self.queue.get()
+        if self.paused and self.queue.qsize() <= _MAX_QUEUED_CHUNKS // 2:
+            self._resume()
+        return chunk
+
+    def close(self):
+        """
+        Stop reading the body, dropping the rest of it.
+        """
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self._resume()
+
+    def _resume(self):
+        if self.paused:
+            self.paused = False
+            self.transport.resume_reading()
+
+
+async def _handle_single_req(server, headers, req_json, path, timings=None):
+    (body, code) = await _handle_root_resp(server, headers, req_json, path, timings)
+    if isinstance(body, ResultStream):
+        return _stream_resp(server, _get_req_id(req_json), body)
+    return _json_resp(body, code)
+
+
+async def _handle_streamed_req(server, req, headers, path, timings=None):
     """
+    Handle a request whose body is read in chunks. The items of a bulk request
+    start as soon as they have been decoded, instead of after the whole body
+    has been parsed.
+    """
+    parser = JSONArrayParser(loads=server['json_codec'].loads)
+    chunks = _parse_chunks(req, parser)
     try:
-        jsonschema.validate(req_json, json_rpc2_schema)
+        # Read until we know whether this is a bulk request
+        items = []  # type: list
+        while parser.is_array is None:
+            items = await chunks.__anext__()
+        if not parser.is_array:
+            return await _handle_single_req(server, headers, items[0], path, timings)
+        if _wants_ndjson(server, headers, path):
+            return _ndjson_streamed_bulk_resp(server, headers, path, items, chunks)
+        tasks = await _start_streamed_bulk(server, headers, path, items, chunks, timings=timings)
+    except (ValueError, _BatchTooLarge) as err:
+        return _json_resp(_rejected_body(server, err), 400)
+    return _json_resp(_join_bulk([body for (body, status) in await asyncio.gather(*tasks)]), 200)
+
+
+async def _parse_chunks(req, parser):
+    """
+    Read the request body chunk by chunk, yielding a list of the newly
+    decoded array elements after each one.
+    """
+    try:
+        while True:
+            chunk = await req.stream.read()
+            if chunk is None:
+                yield parser.close()
+                return
+            yield parser.feed(chunk)
+    finally:
+        # Don't leave the connection paused when the body is left unread
+        req.stream.close()
+
+
+class _BatchTooLarge(Exception):
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+
+async def _start_streamed_bulk(server, headers, path, items, chunks, on_done=None, timings=None):
+    """
+    Start a task for each item of a bulk request as it gets decoded, within
+    the batch limits of the API. Returns the list of tasks once the whole body
+    has been read. If the body turns out to be invalid JSON or the batch too
+    large, all of the tasks are cancelled and ValueError or _BatchTooLarge
+    is raised.
+    """
+    (semaphores, _) = _start_bulk(server, 0, path)
+    api_handler = _get_api_handler(server, path)
+    max_size = api_handler.max_batch_size if api_handler else None
+
+    def start(each):
+        task = asyncio.ensure_future(_handle_bulk_item(server, headers, each, path, semaphores, timings))
+        if on_done is not None:
+            task.add_done_callback(on_done)
+        return task
+    if max_size:
+        # Only start once the whole batch is known to be within the limit, so
+        # that no handler runs for a batch that gets rejected
+        return [start(each) for each in await _read_batch(items, chunks, max_size)]
+    tasks = []  # type: list
+    try:
+        while True:
+            tasks.extend(start(each) for each in items)
+            try:
+                items = await chunks.__anext__()
+            except StopAsyncIteration:
+                return tasks
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def _read_batch(items, chunks, max_size):
+    """
+    Read all of the items of a bulk request. Raises _BatchTooLarge, leaving
+    the rest of the body unread, as soon as more than `max_size` items have
+    been decoded.
+    """
+    items = list(items)
+    while len(items) <= max_size:
+        try:
+            items.extend(await chunks.__anext__())
+        except StopAsyncIteration:
+            return items
+    await chunks.aclose()
+    raise _BatchTooLarge(max_size)
+
+
+def _ndjson_streamed_bulk_resp(server, headers, path, items, chunks):
+    """
+    Stream the responses to a bulk request as newline-delimited JSON while
+    its body is still being read. As the status has already been sent, an
+    invalid body or a batch that is too large ends the stream with an error
+    response line.
+    """
+    async def write(response):
+        done = asyncio.Queue()  # type: asyncio.Queue
+        reading = asyncio.ensure_future(_start_streamed_bulk(server, headers, path, items, chunks, done.put_nowait))
+        # Signal the end of the body with None
+        reading.add_done_callback(lambda _: done.put_nowait(None))
+        (written, total) = (0, None)
+        try:
+            while total is None or written < total:
+                task = await done.get()
+                if task is not None and task.cancelled():
+                    # Cancelled because the body was rejected
+                    continue
+                if task is not None:
+                    (body, status) = task.result()
+                    await response.write(body + b'\n')
+                    written += 1
+                    continue
+                try:
+                    total = len(reading.result())
+                except (ValueError, _BatchTooLarge) as err:
+                    await response.write(_rejected_body(server, err) + b'\n')
+                    return
+        finally:
+            reading.cancel()
+            if reading.done() and not reading.cancelled() and reading.exception() is None:
+                for task in reading.result():
+                    task.cancel()
+    return sanic.response.stream(write, content_type=_NDJSON_TYPE)
+
+
+def _rejected_body(server, err):
+    """
+    Error response body for a streamed body that is invalid JSON or too large a batch.
+    """
+    if isinstance(err, _BatchTooLarge):
+        error = _batch_too_large_err(f'more than {err.max_size}', err.max_size)
+    else:
+        # Use the same message as Sanic for a body that fails to parse
+        error = _invalid_json_err(sanic.exceptions.InvalidUsage("Failed when parsing body as json"))
+    return _error_body(server, None, server['json_codec'].dumps(error))
+
+
+async def _handle_bulk_resp(server, headers, req_json, path, timings=None):
+    """
+    Handle every item of a bulk request concurrently as tasks on the event
+    loop, within the batch limits of the API.
+    Returns the encoded array of responses, in the same order as the request,
+    and the HTTP status code in a pair.
+    """
+    (semaphores, err_body) = _start_bulk(server, len(req_json), path)
+    if err_body is not None:
+        return (err_body, 400)
+    pending = [_handle_bulk_item(server, headers, each, path, semaphores, timings) for each in req_json]
+    return (_join_bulk([body for (body, status) in await asyncio.gather(*pending)]), 200)
+
+
+def _join_bulk(bodies):
+    """
+    Join the encoded responses to the items of a bulk request into an array.
+    """
+    return b'[' + b','.join(bodies) + b']'
+
+
+def _start_bulk(server, size, path):
+    """
+    Check the batch limits of the API for a bulk request of `size` items.
+    Returns the semaphores that each item has to acquire, and an error
+    response body if the batch is rejected, in a pair.
+    """
+    api_handler = _get_api_handler(server, path)
+    semaphores = []  # type: list
+    if api_handler:
+        if api_handler.max_batch_size and size > api_handler.max_batch_size:
+            error = _batch_too_large_err(size, api_handler.max_batch_size)
+            return (semaphores, _error_body(server, None, server['json_codec'].dumps(error)))
+        if api_handler.max_batch_concurrency:
+            semaphores.append(asyncio.Semaphore(api_handler.max_batch_concurrency))
+    if server['bulk_semaphore']:
+        semaphores.append(server['bulk_semaphore'])
+    return (semaphores, None)
+
+
+def _wants_timings(server, headers):
+    """
+    Should the response have a Server-Timing header? Always in development
+    mode, and otherwise only for clients that send the configured token.
+    """
+    if server['development']:
+        return True
+    token = server['server_timing_token']
+    if token is None or _TIMING_HEADER not in headers:
+        return False
+    return hmac.compare_digest(headers[_TIMING_HEADER].encode(), token.encode())
+
+
+_TIMING_HEADER = 'X-Server-Timing'
+
+
+def _wants_ndjson(server, headers, path):
+    """
+    Should the responses to a bulk request be streamed as newline-delimited JSON?
+    """
+    api_handler = _get_api_handler(server, path)
+    if api_handler is None:
+        return False
+    return api_handler.stream_bulk or _NDJSON_TYPE in headers.get('accept', '')
+
+
+def _ndjson_bulk_resp(server, headers, req_json, path):
+    """
+    Stream the responses to a bulk request as newline-delimited JSON, writing
+    each one as soon as its item completes. The responses are in completion
+    order, so clients match them to the request items by id.
+    """
+    (semaphores, err_body) = _start_bulk(server, len(req_json), path)
+    if err_body is not None:
+        return _json_resp(err_body, 400)
+
+    async def write(response):
+        tasks = [asyncio.ensure_future(_handle_bulk_item(server, headers, each, path, semaphores)) for each in req_json]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                (body, status) = await next_done
+                await response.write(body + b'\n')
+        finally:
+            # Stop the remaining items if the client went away
+            for task in tasks:
+                task.cancel()
+    return sanic.response.stream(write, content_type=_NDJSON_TYPE)
+
+
+_NDJSON_TYPE = 'application/x-ndjson'
+_METRICS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+async def _handle_bulk_item(server, headers, req_json, path, semaphores, timings=None):
+    """
+    Handle one item of a bulk request once it has acquired all the semaphores.
+    The per-batch semaphore comes first, so that a batch waiting on the per-worker
+    limit only holds as many slots as it can use.
+    """
+    for semaphore in semaphores:
+        await semaphore.acquire()
+    try:
+        (body, code) = await _handle_root_resp(server, headers, req_json, path, timings)
+        # Streamed results are not streamed inside of bulk responses
+        if isinstance(body, ResultStream):
+            try:
+                result = await body.collect()
+            except Exception as err:
+                error = server['json_codec'].dumps(_server_err(err))
+                return (_error_body(server, _get_req_id(req_json), error), 500)
+            return (_result_body(server, _get_req_id(req_json), server['json_codec'].dumps(result)), code)
+        return (body, code)
+    finally:
+        for semaphore in semaphores:
+            semaphore.release()
+
+
+def _get_api_handler(server, path):
+    """
+    Get the API object for a subpath, or None if there is no such subpath.
+    """
+    return server['dispatch'].apis.get(path or None)
+
+
+async def _handle_root_resp(server, headers, req_json, path, timings=None):
+    """
+    Returns the encoded JSON body of the response and the HTTP status code in
+    a pair. The body is a ResultStream instead if the result gets streamed.
+    `headers` is a read-only, case-insensitive mapping of the request headers.
+    The time spent in each phase is added to `timings`, if given.
+    """
+    timer = start_timer(timings)
+    try:
+        validate_envelope(req_json)
     except jsonschema.exceptions.ValidationError as err:
         error_logger.debug(err)
-        return (_invalid_json_rpc_resp(req_json, err), 400)
-    headers = dict(req.headers)
+        error = server['json_codec'].dumps(_invalid_json_rpc_err(err))
+        return (_error_body(server, _get_req_id(req_json), error), 400)
     meth_name = req_json['method']
-    if path:
-        if path not in api.subpaths:
-            return (None, 404)
-        api_handler = api.subpaths[path]
-    else:
-        api_handler = api
-    if meth_name not in api_handler.method_names:
-        return (_unknown_method_resp(req_json, meth_name), 400)
-    meth_id = api_handler.method_names[meth_name]
-    meth = api_handler.methods[meth_id]
+    req_id = req_json.get('id')
+    path = path or None
+    meth = server['dispatch'].methods.get((path, meth_name))
+    if meth is None:
+        if path not in server['dispatch'].apis:
+            return (b'null', 404)
+        error = _static_err(server, ('unknown_method', path, meth_name), _unknown_method_err, meth_name)
+        return (_error_body(server, req_id, error), 400)
+    timer.lap('envelope')
+    metrics = server['metrics']
+    if metrics is None:
+        (body, status, _) = await _handle_call(server, meth, headers, req_json, path, timer)
+        return (body, status)
+    start = time.perf_counter()
+    (body, status, error_code) = await _handle_call(server, meth, headers, req_json, path, timer)
+    metrics.record(meth, error_code, time.perf_counter() - start)
+    return (body, status)
+
+
+async def _handle_call(server, meth, headers, req_json, path, timer=NO_TIMER):
+    """
+    Validate and run a call to a known method, returning the response body
+    and HTTP status code, like `_handle_root_resp`, and the JSON RPC error
+    code or None, in a triple. Each phase is timed with `timer`.
+    """
+    req_id = req_json.get('id')
     # Validate the headers
-    if 'headers' in meth:
-        for (key, pattern) in meth['headers']:
-            if key not in headers:
-                return (_missing_header_resp(req_json, key), 400)
-            if not re.match(pattern, headers[key]):
-                return (_invalid_header_resp(req_json, key, pattern), 400)
+    for (key, regex) in meth.headers:
+        if key not in headers:
+            error = _static_err(server, ('missing_header', key), _missing_header_err, key)
+            return (_error_body(server, req_id, error), 400, _INVALID_PARAMS)
+        if regex is not None and not regex.match(headers[key]):
+            error = _static_err(server, ('invalid_header', key, regex.pattern), _invalid_header_err, key, regex.pattern)
+            return (_error_body(server, req_id, error), 400, _INVALID_PARAMS)
+    timer.lap('headers')
     # Validate the parameters
-    if 'params_schema' in meth:
+    if meth.params_validator is not None:
         if req_json.get('params') is None:
-            return (_missing_params_resp(req_json), 400)
-        try:
-            jsonschema.validate(req_json.get('params'), meth['params_schema'])
-        except jsonschema.exceptions.ValidationError as err:
-            return (_invalid_params_resp(req_json, err), 400)
+            error = _static_err(server, ('missing_params',), _missing_params_err)
+            return (_error_body(server, req_id, error), 400, _INVALID_PARAMS)
+        # A generated check only tells us whether the params are valid. When
+        # it fails, or there is none, jsonschema finds the actual error.
+        params_check = meth.params_check
+        if params_check is None or not params_check(req_json['params']):
+            try:
+                validate(meth.params_validator, req_json['params'])
+            except jsonschema.exceptions.ValidationError as err:
+                timer.lap('params')
+                error = server['json_codec'].dumps(_invalid_params_err(err))
+                return (_error_body(server, req_id, error), 400, _INVALID_PARAMS)
+        # Fill in defaults in place once the params are known to be valid
+        if meth.params_defaults is not None:
+            apply_defaults(meth.params_defaults, req_json['params'])
+        timer.lap('params')
+    # Return a cached result, if any. This comes after validation so that
+    # invalid requests are never cached. Results are cached already encoded.
+    cache = meth.cache
+    if cache is not None:
+        cache_key = make_key(req_json.get('params'), headers, cache.headers)
+        encoded = cache.get(cache_key)
+        if server['metrics']:
+            server['metrics'].record_cache(meth, encoded is not MISSING)
+        timer.lap('cache')
+        if encoded is not MISSING:
+            return (_result_body(server, req_id, encoded), 200, None)
     # Compute the result
-    func = meth['func']
+    params = req_json.get('params')
     try:
-        result = func(req_json.get('params'), headers)
+        if meth.coalesce is not None:
+            result = await _call_coalesced(server, meth, path, meth.name, params, headers)
+        else:
+            result = await _call_handler(server, meth, params, headers)
     except Exception as err:
-        return (_server_err_resp(req_json, err), 500)
+        timer.lap('handler')
+        error = _server_err(err)
+        return (_error_body(server, req_id, server['json_codec'].dumps(error)), 500, error['code'])
+    timer.lap('handler')
+    if is_stream(result):
+        # Results from generators are streamed and validated item by item
+        executor = None if meth.inline else server['executor']
+        item_validator = meth.result_items_validator if server['development'] else None
+        return (ResultStream(result, executor, item_validator), 200, None)
+    if meth.result_defaults is not None:
+        apply_defaults(meth.result_defaults, result)
     # Validate the result
-    if development and 'result_schema' in meth:
-        jsonschema.validate(result, meth['result_schema'])
-    return ({
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'result': result
-    }, 200)
-
-
-def _handle_root_resp_async(api, req, req_json, development, resp_queue, path):
-    (resp, status) = _handle_root_resp(api, req, req_json, development, path)
-    resp_queue.put(resp)
-
-
-# A forgiving JSON Schema for JSON RPC 2.0. Does not require the "jsonrpc" or
-# "id" fields.
-json_rpc2_schema = {
-    'type': 'object',
-    'required': ['method'],
-    'properties': {
-        'method': {
-            'type': 'string'
-        },
-        'id': {
-            'type': ['integer', 'string', 'number', 'null']
-        },
-        'params': {
-            'type': ['array', 'object']
-        },
-        'jsonrpc': {
-            'const': '2.0'
-        }
+    sampled = False
+    if meth.result_validator is not None:
+        if server['development']:
+            validate(meth.result_validator, result)
+            timer.lap('result')
+        else:
+            sampled = _sample_result(server, meth)
+    encoded = server['json_codec'].dumps(result)
+    if sampled:
+        _check_result_later(server, meth, encoded)
+    if cache is not None:
+        cache.set(cache_key, encoded)
+    timer.lap('encode')
+    return (_result_body(server, req_id, encoded), 200, None)
+
+
+def _sample_result(server, meth):
+    """
+    Should this result of a method be validated in production?
+    """
+    rate = meth.result_validation_rate
+    if rate is None:
+        rate = server['result_validation_rate']
+    return rate > 0 and random.random() < rate
+
+
+def _check_result_later(server, meth, encoded):
+    """
+    Validate a sampled result in the thread pool, once the response has been
+    written, so that it doesn't slow down the response. An invalid result is
+    logged and counted in the metrics, and the request is not affected.
+
+    The encoded result is decoded again for validation, rather than using the
+    result object, which coalesced calls share and may still be changing.
+    """
+    loop = asyncio.get_event_loop()
+    loads = server['json_codec'].loads
+
+    def report(fut):
+        if not fut.cancelled():
+            _report_result_error(server, meth, fut.result())
+
+    def start():
+        future = loop.run_in_executor(server['executor'], _result_error, meth.result_validator, loads, encoded)
+        future.add_done_callback(report)
+    loop.call_soon(start)
+
+
+def _result_error(validator, loads, encoded):
+    """
+    Validate an encoded result, returning the error message, or None if it is
+    valid. A result that can't be validated at all also counts as invalid.
+    """
+    try:
+        validate(validator, loads(encoded))
+    except jsonschema.exceptions.ValidationError as err:
+        path = '/'.join(str(key) for key in err.absolute_path)
+        return f"{err.message} (at '/{path}')"
+    except Exception as err:
+        return f"validation failed with {type(err).__name__}: {err}"
+    return None
+
+
+def _report_result_error(server, meth, error):
+    if server['metrics']:
+        server['metrics'].record_result_check(meth, error is None)
+    if error is not None:
+        error_logger.warning(f"Result of method '{meth.name}' does not match its schema: {error}")
+
+
+async def _call_handler(server, meth, params, headers):
+    """
+    Run a method handler in the way it was registered, returning its result.
+    """
+    func = meth.func
+    if meth.is_async:
+        return await func(params, headers)
+    elif meth.inline or meth.is_generator:
+        # Calling a generator function only creates the generator
+        return func(params, headers)
+    loop = asyncio.get_event_loop()
+    if meth.cpu_bound:
+        # The read-only view of the headers can't be pickled, so send a copy
+        return await server['process_pool'].run(func, params, dict(headers))
+    # Run synchronous handlers in the worker's thread pool so they don't block
+    # the event loop
+    return await loop.run_in_executor(server['executor'], func, params, headers)
+
+
+async def _call_coalesced(server, meth, path, meth_name, params, headers):
+    """
+    Run a method handler, sharing a single execution between all identical
+    calls that are in flight at the same time on this worker.
+    """
+    in_flight = server['in_flight']
+    key = (path, meth_name, make_key(params, headers, meth.coalesce))
+    if key not in in_flight:
+        future = asyncio.ensure_future(_call_handler(server, meth, params, headers))
+        in_flight[key] = future
+        future.add_done_callback(lambda _: in_flight.pop(key, None))
+    # Shield the shared call, so one caller going away doesn't cancel it for the others
+    return await asyncio.shield(in_flight[key])
+
+
+def _json_resp(body, status=200):
+    """
+    Response for an already encoded JSON body.
+    """
+    return sanic.response.raw(body, status, content_type='application/json')
+
+
+# Fixed parts of a JSON RPC response, which get spliced together with the
+# encoded id and result or error
+_RESP_PREFIX = b'{"jsonrpc":"2.0","id":'
+_RESULT_INFIX = b',"result":'
+_ERROR_INFIX = b',"error":'
+
+
+def _result_body(server, req_id, result):
+    """
+    Encode a JSON RPC response from an already encoded result.
+    """
+    return b''.join((_RESP_PREFIX, _encode_id(server, req_id), _RESULT_INFIX, result, b'}'))
+
+
+def _error_body(server, req_id, error):
+    """
+    Encode a JSON RPC error response from an already encoded error object.
+    """
+    return b''.join((_RESP_PREFIX, _encode_id(server, req_id), _ERROR_INFIX, error, b'}'))
+
+
+def _encode_id(server, req_id):
+    if req_id is None:
+        return b'null'
+    return server['json_codec'].dumps(req_id)
+
+
+def _static_err(server, key, make_error, *args):
+    """
+    Get an encoded error object that only depends on `key`, such as the error
+    for an unknown method name on a subpath, caching it on the server.
+    """
+    error_cache = server['error_cache']
+    error = error_cache.get(key)
+    if error is None:
+        error = server['json_codec'].dumps(make_error(*args))
+        # Don't let clients grow the cache without bounds with made up method names
+        if len(error_cache) < _MAX_CACHED_ERRORS:
+            error_cache[key] = error
+    return error
+
+
+_MAX_CACHED_ERRORS = 1024
+# JSON RPC error code of invalid params and headers
+_INVALID_PARAMS = -32602
+
+
+def _stream_resp(server, req_id, stream):
+    """
+    Stream a response whose result is a ResultStream, as a JSON array written
+    in chunks of about `_STREAM_CHUNK_SIZE` bytes.
+    """
+    dumps = server['json_codec'].dumps
+    prefix = b''.join((_RESP_PREFIX, _encode_id(server, req_id), _RESULT_INFIX, b'['))
+
+    async def write(response):
+        (chunk, size, first) = ([prefix], 0, True)
+        try:
+            async for item in stream:
+                encoded = dumps(item)
+                chunk.append(encoded if first else b',' + encoded)
+                first = False
+                size += len(encoded)
+                if size >= _STREAM_CHUNK_SIZE:
+                    await response.write(b''.join(chunk))
+                    (chunk, size) = ([], 0)
+        except Exception as err:
+            # The status has already been sent, so the best we can do is to
+            # stop, leaving an incomplete JSON body
+            error_logger.error(f"Error while streaming a result: {err}")
+            error_logger.error(traceback.format_exc())
+            return
+        chunk.append(b']}')
+        await response.write(b''.join(chunk))
+    return sanic.response.stream(write, content_type='application/json')
+
+
+_STREAM_CHUNK_SIZE = 65536
+
+
+def _unknown_method_err(meth_name):
+    return {
+        'code': -32601,
+        'message': f"Unknown method: '{meth_name}'"
     }
-}
 
 
-def _unknown_method_resp(req_json, meth_name):
+def _batch_too_large_err(size, max_size):
     return {
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'error': {
-            'code': -32601,
-            'message': f"Unknown method: '{meth_name}'"
+        'code': -32600,
+        'message': f"Batch too large: {size} items given, but the maximum is {max_size}",
+        'data': {
+            'max_batch_size': max_size
         }
     }
 
 
-def _invalid_json_resp(req, err):
+def _invalid_json_err(err):
     return {
-        'jsonrpc': '2.0',
-        'id': None,
-        'error': {
-            'code': -32700,
-            'message': str(err)
-        }
+        'code': -32700,
+        'message': str(err)
     }
 
 
-def _invalid_json_rpc_resp(req_json, err):
+def _invalid_json_rpc_err(err):
     return {
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'error': {
-            'code': -32600,
-            'message': 'Invalid JSON RPC 2.0 request',
-            'data': {
-                'validation_error': err.message,
-                'value': err.instance,
-                'path': list(err.absolute_path)
-            }
+        'code': -32600,
+        'message': 'Invalid JSON RPC 2.0 request',
+        'data': {
+            'validation_error': err.message,
+            'value': err.instance,
+            'path': list(err.absolute_path)
         }
     }
 
 
-def _invalid_params_resp(req_json, err):
+def _invalid_params_err(err):
     """
     JSON Schema validation error on the params.
     """
     return {
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'error': {
-            'code': -32602,
-            'message': err.message,
-            'data': {
-                'failed_validator': err.validator,
-                'value': err.instance,
-                'path': list(err.absolute_path)
-            }
+        'code': -32602,
+        'message': err.message,
+        'data': {
+            'failed_validator': err.validator,
+            'value': err.instance,
+            'path': list(err.absolute_path)
         }
     }
 
 
-def _server_err_resp(req_json, err):
+def _server_err(err):
     """
     Server error, possibly unexpected
     """
@@ -289,17 +852,13 @@ def _server_err_resp(req_json, err):
         code = err.error_code
     else:
         code = -32000
-    resp = {
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'error': {
-            'code': code,
-            'message': str(err)
-        }
+    error = {
+        'code': code,
+        'message': str(err)
     }
     if hasattr(err, 'resp_data'):
-        resp['error']['data'] = err.resp_data
-    return resp
+        error['data'] = err.resp_data
+    return error
 
 
 def _get_req_id(req_json):
@@ -309,37 +868,22 @@ def _get_req_id(req_json):
         return None
 
 
-def _missing_params_resp(req_json):
-    resp = {
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'error': {
-            'code': -32602,
-            'error': 'Missing params'
-        }
+def _missing_params_err():
+    return {
+        'code': -32602,
+        'error': 'Missing params'
     }
-    return resp
 
 
-def _missing_header_resp(req_json, key):
-    resp = {
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'error': {
-            'code': -32602,
-            'error': f"Header with key '{key}' required but not provided."
-        }
+def _missing_header_err(key):
+    return {
+        'code': -32602,
+        'error': f"Header with key '{key}' required but not provided."
     }
-    return resp
 
 
-def _invalid_header_resp(req_json, key, pattern):
-    resp = {
-        'jsonrpc': '2.0',
-        'id': _get_req_id(req_json),
-        'error': {
-            'code': -32602,
-            'error': f"Header with key '{key}' does not match the format '{pattern}'."
-        }
+def _invalid_header_err(key, pattern):
+    return {
+        'code': -32602,
+        'error': f"Header with key '{key}' does not match the format '{pattern}'."
     }
-    return resp
@@ -1,7 +1,17 @@
 """
 Generate API documentation from an API object.
+
+Each doc file starts with a hash of everything that goes into it. When the
+API hasn't changed since the file was generated, rendering is skipped, and
+otherwise the file is replaced atomically.
 """
+import hashlib
 import json
+import os
+import tempfile
+
+# Bump when the rendered output changes, so that existing docs get regenerated
+_DOCS_VERSION = 3
 
 
 def generate_docs(api):
@@ -17,160 +27,238 @@ def generate_single_docs(api):
     Generate documentation from an API object.
     """
     path = api.doc_path
-    with open(path, 'w') as fd:
-        fd.write('')
-    with open(path, 'a') as fd:
-        # Write title
-        fd.write(f'# {api.title}\n\n')
-        # Write description
-        fd.write(f'{api.desc}\n\n')
-        # Table of contents
-        fd.write(f'## Table of Contents\n\n')
-        if api.methods:
-            fd.write(f'[Methods](#methods) ({len(api.methods)} total)\n')
-            for (_id, meth) in api.methods.items():
-                deprec_reason = meth.get('deprecated')
-                if deprec_reason:
-                    fd.write(f'* ~~[{meth["name"]}](#{meth["name"]})~~\n')
-                else:
-                    fd.write(f'* [{meth["name"]}](#{meth["name"]})\n')
-            fd.write('\n')
-        if api.refs:
-            fd.write(f'[Data Types](#datatypes) ({len(api.refs)} total)\n')
-            for (_id, schema) in api.refs.items():
-                fd.write(f'* [{_id}]({_id})\n')
-            fd.write('\n')
-        # Write methods
-        fd.write(f'## <a name="methods">Methods</a>\n\n')
-        for (meth_name, meth_id) in api.method_names.items():
-            meth = api.methods[meth_id]
-            meth_title = _get_method_signature(meth)
-            params_schema = meth.get('params_schema')
-            result_schema = meth.get('result_schema')
+    header = f'<!-- Generated by brontosaurus. Content hash: {_docs_hash(api)} -->\n'
+    if _read_first_line(path) == header:
+        return path
+    # Write to a temporary file next to the docs, and rename it over them once complete
+    (tmp_fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(tmp_fd, 'w') as fd:
+            fd.write(header)
+            _write_docs(api, fd)
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def _write_docs(api, fd):
+    """
+    Write the Markdown documentation of an API to a file object.
+    """
+    # Write title
+    fd.write(f'# {api.title}\n\n')
+    # Write description
+    fd.write(f'{api.desc}\n\n')
+    # Table of contents
+    fd.write(f'## Table of Contents\n\n')
+    if api.methods:
+        fd.write(f'[Methods](#methods) ({len(api.methods)} total)\n')
+        for (_id, meth) in api.methods.items():
             deprec_reason = meth.get('deprecated')
-            fd.write(f'### <a name=\'{meth["name"]}\'>' + meth_title + '</a>\n\n')
             if deprec_reason:
-                fd.write(f'**This method is deprecated:** {deprec_reason}\n\n')
-            fd.write(f"{meth['summary']}\n\n")
-            if params_schema:
-                if '$id' in params_schema:
-                    fd.write(f"**Parameters type:** [{params_schema['$id']}]({params_schema['$id']})\n\n")
-                else:
-                    fd.write(f'**Parameters:** ')
-                    fd.write(_format_generic_json(params_schema) + '\n')
+                fd.write(f'* ~~[{meth["name"]}](#{meth["name"]})~~\n')
             else:
-                fd.write(f"**No parameters**\n\n")
-            required_headers = meth.get('headers')
-            if required_headers:
-                fd.write(f"**Required headers**:\n\n")
-                for (key, pattern) in required_headers:
-                    if pattern:
-                        fd.write(f' * `{key}` must have format "`{pattern}`"\n')
-                    else:
-                        fd.write(f" * `{key}`\n")
-                fd.write("\n")
-            if result_schema:
-                if '$id' in result_schema:
-                    fd.write(f"**Result type:** [{result_schema['$id']}]({result_schema['$id']})\n\n")
+                fd.write(f'* [{meth["name"]}](#{meth["name"]})\n')
+        fd.write('\n')
+    if api.refs:
+        fd.write(f'[Data Types](#datatypes) ({len(api.refs)} total)\n')
+        for (_id, schema) in api.refs.items():
+            fd.write(f'* [{_id}]({_id})\n')
+        fd.write('\n')
+    # Write methods
+    fd.write(f'## <a name="methods">Methods</a>\n\n')
+    for (meth_name, meth_id) in api.method_names.items():
+        meth = api.methods[meth_id]
+        meth_title = _get_method_signature(meth)
+        params_schema = meth.get('params_schema')
+        result_schema = meth.get('result_schema')
+        deprec_reason = meth.get('deprecated')
+        fd.write(f'### <a name=\'{meth["name"]}\'>' + meth_title + '</a>\n\n')
+        if deprec_reason:
+            fd.write(f'**This method is deprecated:** {deprec_reason}\n\n')
+        fd.write(f"{meth['summary']}\n\n")
+        if params_schema:
+            if '$id' in params_schema:
+                fd.write(f"**Parameters type:** [{params_schema['$id']}]({params_schema['$id']})\n\n")
+            else:
+                fd.write(f'**Parameters:** ')
+                _write_generic_json(fd, params_schema)
+                fd.write('\n')
+        else:
+            fd.write(f"**No parameters**\n\n")
+        required_headers = meth.get('headers')
+        if required_headers:
+            fd.write(f"**Required headers**:\n\n")
+            for (key, regex) in required_headers:
+                if regex is not None and regex.pattern:
+                    fd.write(f' * `{key}` must have format "`{regex.pattern}`"\n')
                 else:
-                    fd.write(f'**Result:** ')
-                    fd.write(_format_generic_json(result_schema) + '\n')
+                    fd.write(f" * `{key}`\n")
+            fd.write("\n")
+        if result_schema:
+            if '$id' in result_schema:
+                fd.write(f"**Result type:** [{result_schema['$id']}]({result_schema['$id']})\n\n")
             else:
-                fd.write(f"**No results**\n\n")
-        # Write types
-        fd.write(f'# <a name="datatypes">Data Types</a>\n\n')
-        for (_id, schema) in api.refs.items():
-            id_without_hash = _id.replace('#', '')
-            fd.write(f"## <a name=\"{id_without_hash}\">[{schema['$id']}]({schema['$id']})</a>\n\n")
-            if 'description' in schema:
-                fd.write(f"{schema['description']}\n\n")
-            if _id in api.methods_using:
-                methods_using = api.methods_using[_id]
-                if methods_using:
-                    method_names = [api.methods[mid]['name'] for mid in methods_using]
-                    method_names_str = ', '.join(f"[{n}](#{n})" for n in method_names)
-                    fd.write(f"Methods using this type: {method_names_str}\n\n")
-            fd.write(_format_generic_json(schema) + '\n')
-    return path
+                fd.write(f'**Result:** ')
+                _write_generic_json(fd, result_schema)
+                fd.write('\n')
+        else:
+            fd.write(f"**No results**\n\n")
+    # Write types
+    fd.write(f'# <a name="datatypes">Data Types</a>\n\n')
+    for (_id, schema) in api.refs.items():
+        id_without_hash = _id.replace('#', '')
+        fd.write(f"## <a name=\"{id_without_hash}\">[{schema['$id']}]({schema['$id']})</a>\n\n")
+        if 'description' in schema:
+            fd.write(f"{schema['description']}\n\n")
+        method_names = _get_methods_using(api, _id)
+        if method_names:
+            method_names_str = ', '.join(f"[{n}](#{n})" for n in method_names)
+            fd.write(f"Methods using this type: {method_names_str}\n\n")
+        _write_generic_json(fd, schema)
+        fd.write('\n')
+
+
+def _get_methods_using(api, _id):
+    """
+    Names of the methods using a type, in the order they were registered.
+    """
+    methods_using = api.methods_using.get(_id, ())
+    return [meth['name'] for (mid, meth) in api.methods.items() if mid in methods_using]
+
+
+def _docs_hash(api):
+    """
+    Hash everything that the docs of an API are rendered from.
+    """
+    methods = [
+        {
+            'name': meth.get('name'),
+            'summary': meth.get('summary'),
+            'deprecated': meth.get('deprecated'),
+            'params_schema': meth.get('params_schema'),
+            'result_schema': meth.get('result_schema'),
+            'headers': [(key, regex.pattern if regex else None) for (key, regex) in meth.get('headers', ())],
+        }
+        for meth in api.methods.values()
+    ]
+    content = {
+        'version': _DOCS_VERSION,
+        'title': api.title,
+        'desc': api.desc,
+        'methods': methods,
+        'method_names': list(api.method_names),
+        'refs': list(api.refs.items()),
+        'methods_using': [_get_methods_using(api, _id) for _id in api.refs],
+    }
+    # Keys are not sorted, as the order of schema properties shows in the docs
+    encoded = json.dumps(content, default=repr).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as fd:
+            return fd.readline()
+    except (FileNotFoundError, UnicodeDecodeError):
+        return None
+
+
+def _file_mode(path):
+    """
+    Permissions for the docs: those of the existing file, or the default for new files.
+    """
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _dumps(val):
+    """
+    Encode a JSON value shown in the docs, such as an enum or example. The
+    standard library is always used, so that the docs are the same whichever
+    JSON codec the server uses.
+    """
+    return json.dumps(val, indent=2, sort_keys=True)
 
 
-def _format_keyval(key, val, parent, obj_indent):
+def _write_keyval(fd, key, val, schema, indent):
     """
-    Return a special format for a key-val entry in a JSON object.
+    Write a special format for a key-val entry in a JSON schema. Returns
+    False if the entry has no special format, and should be written as is.
     """
     if key == '$id' or key == 'type' or key == '$ref':
-        return False
-    elif key == 'enum':
-        enum_names = ', '.join(f'`{json.dumps(v)}`' for v in val)
-        return f'Must be one of: {enum_names}\n'
+        return True
+    bullet = ('  ' * indent) + '* '
+    if key == 'enum':
+        enum_names = ', '.join(f'`{_dumps(v)}`' for v in val)
+        fd.write(f'{bullet}Must be one of: {enum_names}\n')
     elif key == 'examples':
-        ex = ', '.join(f'`{json.dumps(v)}`' for v in val)
-        return f'Examples: {ex}\n'
+        ex = ', '.join(f'`{_dumps(v)}`' for v in val)
+        fd.write(f'{bullet}Examples: {ex}\n')
     elif key == 'required':
         if not isinstance(val, list):
             val = [val]
         prop_names = ', '.join(val)
-        return f'Required fields: **{prop_names}**\n'
+        fd.write(f'{bullet}Required fields: **{prop_names}**\n')
     elif key == 'properties':
-        return 'Properties:\n' + _format_obj_props(val, obj_indent + 1, parent)
-    elif key == 'additionalProperties':
-        if val is False:
-            return 'No extra properties allowed\n'
-        elif val is True:
-            return 'Additional properties are allowed\n'
-        elif val:
-            return 'Additional properties:\n' + _format_generic_json(val, obj_indent + 1, parent) + '\n'
-    elif key == 'additionalItems':
+        fd.write(f'{bullet}Properties:\n')
+        _write_obj_props(fd, val, indent + 1, schema)
+    elif key == 'patternProperties':
+        fd.write(f'{bullet}Pattern properties:\n')
+        _write_obj_props(fd, val, indent + 1, schema)
+    elif (key == 'additionalProperties' or key == 'additionalItems') and (val is False or val is True or val):
+        noun = 'properties' if key == 'additionalProperties' else 'elements'
         if val is False:
-            return 'No extra elements allowed\n'
+            fd.write(f'{bullet}No extra {noun} allowed\n')
         elif val is True:
-            return 'Additional elements are allowed\n'
-        elif val:
-            return 'Additional elements:\n' + _format_generic_json(val, obj_indent + 1, parent) + '\n'
-    elif (key == 'allOf' or key == 'anyOf') and val:
-        if key == 'allOf':
-            string = 'Must match all of:\n'
+            fd.write(f'{bullet}Additional {noun} are allowed\n')
         else:
-            string = 'Must match any of:\n'
-        indent = obj_indent + 1
+            fd.write(f'{bullet}Additional {noun}:\n')
+            _write_generic_json(fd, val, indent + 1)
+            fd.write('\n')
+    elif (key == 'allOf' or key == 'anyOf') and val:
+        fd.write(bullet + ('Must match all of:\n' if key == 'allOf' else 'Must match any of:\n'))
         for typ in val:
-            string += ('  ' * indent) + '1. ' + _format_generic_json(val, indent + 1, parent)
-        return string
-    elif key == 'patternProperties':
-        return 'Pattern properties:\n' + _format_obj_props(val, obj_indent + 1, parent)
+            fd.write(('  ' * (indent + 1)) + '1. ')
+            _write_generic_json(fd, typ, indent + 2)
     elif key == 'items' and isinstance(val, list) and val:
-        string = f'Elements:\n'
-        indent = obj_indent + 1
+        fd.write(f'{bullet}Elements:\n')
         for (idx, typ) in enumerate(val):
-            string += ('  ' * indent) + f'* Item {idx}: ' + _format_generic_json(typ, indent + 1, parent)
-        return string
+            fd.write(('  ' * (indent + 1)) + f'* Item {idx}: ')
+            _write_generic_json(fd, typ, indent + 2)
     elif key == 'description':
-        return f'Description: {val}\n'
+        fd.write(f'{bullet}Description: {val}\n')
+    else:
+        return False
+    return True
 
 
-def _format_obj_props(props, indent, parent):
+def _write_obj_props(fd, props, indent, schema):
     """
-    Format a set of property name and type values for an object schema.
+    Write a set of property name and type values for an object schema.
     """
-    string = ''
+    required = set(schema.get('required', set()))
     for (prop, typ) in props.items():
-        string += ('  ' * indent) + f'* `"{prop}"` – {_format_generic_json(typ, indent + 1, prop, parent)}'
-    return string
+        fd.write(('  ' * indent) + f'* `"{prop}"` – ')
+        _write_generic_json(fd, typ, indent + 1, prop in required)
 
 
-def _format_obj_prefix(schema, indent, parent, prop_name):
+def _format_obj_prefix(schema, required=False):
     """
     Create a string prefix (possibly None) for a schema object.
     Usually this will show the schema's type and whether it is required in any parent object.
     """
     if not isinstance(schema, dict):
         return None
-    string = ''
+    string = 'required ' if required else ''
     typ = schema.get('type')
-    if parent:
-        required = set(parent.get('required', set()))
-        if prop_name and prop_name in required:
-            string = 'required '
     if schema.get('$ref'):
         ref = schema['$ref']
         string += f"**[{ref}]({ref})**"
@@ -183,63 +271,54 @@ def _format_obj_prefix(schema, indent, parent, prop_name):
     return string
 
 
-def _format_generic_json(data, obj_indent=0, prop_name=None, parent=None):
+def _write_generic_json(fd, data, obj_indent=0, required=False):
     """
-    Render any JSON serializable data structure as bulleted markdown.
-    Special formatting for JSON schemas are injected using:
-    - _format_keyval
+    Write any JSON serializable data structure as bulleted markdown, visiting
+    each value once. Special formatting for JSON schemas are injected using:
+    - _write_keyval
     - _format_obj_prefix
+    `required` marks the schema of a required property, and carries over to
+    the values nested in it.
     """
-    string = ''
     if isinstance(data, dict) and not data:
-        return 'any type\n'
+        fd.write('any type\n')
+        return
     elif isinstance(data, list) and not data:
-        return 'empty array\n'
-    prefix = _format_obj_prefix(data, obj_indent, parent, prop_name)
+        fd.write('empty array\n')
+        return
+    prefix = _format_obj_prefix(data, required)
     if prefix:
-        string += prefix + '\n'
+        fd.write(prefix + '\n')
     if isinstance(data, dict):
         for (key, val) in data.items():
-            sub = _format_generic_json(val, obj_indent + 1, prop_name, parent)
-            keyval = _format_keyval(key, val, data, obj_indent)
-            if keyval is False:
+            if _write_keyval(fd, key, val, data, obj_indent):
                 continue
-            if keyval:
-                string += ('  ' * obj_indent) + '* ' + keyval
-                continue
-            string += ('  ' * obj_indent) + f'* {key}: '
-            if isinstance(val, dict):
-                if not val:
-                    string += 'any type\n'
-                else:
-                    string += f'{sub}'
-            elif isinstance(val, list):
-                if not val:
-                    string += f'empty array\n'
-                else:
-                    string += f'array of:\n{sub}'
-            else:
-                string += f'{sub}\n'
-        return string
+            fd.write(('  ' * obj_indent) + f'* {key}: ')
+            _write_nested(fd, val, obj_indent + 1, required, newline=False)
     elif isinstance(data, list):
-        for (idx, val) in enumerate(data):
-            sub = _format_generic_json(val, obj_indent + 1, prop_name, parent)
-            string += ('  ' * obj_indent) + '* '
-            if isinstance(val, dict):
-                if val:
-                    string += f'\n{sub}'
-                else:
-                    string += 'any type\n'
-            elif isinstance(val, list):
-                if val:
-                    string += f'array of:\n{sub}'
-                else:
-                    string += 'empty array\n'
-            else:
-                string += f'{sub}\n'
-        return string
+        for val in data:
+            fd.write(('  ' * obj_indent) + '* ')
+            _write_nested(fd, val, obj_indent + 1, required, newline=True)
+    else:
+        fd.write(str(data))
+
+
+def _write_nested(fd, val, indent, required, newline):
+    """
+    Write a value after a bullet. Scalars stay on the bullet's line, and
+    objects start on the next line if `newline` is set.
+    """
+    if isinstance(val, dict):
+        if val and newline:
+            fd.write('\n')
+        _write_generic_json(fd, val, indent, required)
+    elif isinstance(val, list):
+        if val:
+            fd.write('array of:\n')
+        _write_generic_json(fd, val, indent, required)
     else:
-        return str(data)
+        _write_generic_json(fd, val, indent, required)
+        fd.write('\n')
 
 
 def _get_method_signature(method):
@@ -0,0 +1,339 @@
+"""
+Generate specialized Python validation functions from JSON Schemas.
+
+This is an optional, faster alternative to the interpreted `jsonschema`
+validators. Each schema is turned into Python source with the type checks,
+required keys, enum sets, bounds and compiled regexes inlined, which is then
+`exec`ed into a single function. A generated function only answers whether
+an instance is valid; on failure the regular `jsonschema` validator is run to
+produce the error, so error responses are the same for both engines.
+"""
+import re
+
+import jsonschema.validators
+
+# Schema drafts with the validation semantics implemented here
+_SUPPORTED_DRAFTS = (jsonschema.Draft6Validator, jsonschema.Draft7Validator)
+
+# Keywords that are validated by jsonschema but cannot be compiled. The
+# "format" keyword is only checked when jsonschema is given a format checker,
+# which brontosaurus does not use, so it is ignored here too.
+_UNSUPPORTED = set(jsonschema.Draft7Validator.VALIDATORS) - {
+    '$ref', 'type', 'enum', 'const', 'format', 'required', 'properties', 'patternProperties',
+    'additionalProperties', 'minProperties', 'maxProperties', 'items', 'additionalItems',
+    'minItems', 'maxItems', 'minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum',
+    'minLength', 'maxLength', 'pattern', 'allOf', 'anyOf', 'oneOf', 'not',
+}
+
+# Python expressions for each JSON Schema type, formatted with a variable name
+_TYPE_EXPRS = {
+    'object': 'isinstance({v}, dict)',
+    'array': 'isinstance({v}, list)',
+    'string': 'isinstance({v}, str)',
+    'boolean': 'isinstance({v}, bool)',
+    'null': '{v} is None',
+    'number': '(isinstance({v}, (int, float)) and not isinstance({v}, bool))',
+    'integer': ('((isinstance({v}, int) and not isinstance({v}, bool))'
+                ' or (isinstance({v}, float) and {v}.is_integer()))'),
+}
+
+_OBJECT_KEYWORDS = ('required', 'properties', 'patternProperties', 'additionalProperties',
+                    'minProperties', 'maxProperties')
+_ARRAY_KEYWORDS = ('items', 'additionalItems', 'minItems', 'maxItems')
+_NUMBER_KEYWORDS = ('minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum')
+_STRING_KEYWORDS = ('minLength', 'maxLength', 'pattern')
+
+
+def generate_validator(schema, refs=None):
+    """
+    Generate a function that returns whether an instance is valid against a schema.
+    References in the form of `#id` are looked up in `refs`.
+    Returns None if the schema uses features that cannot be compiled.
+    """
+    if jsonschema.validators.validator_for(schema) not in _SUPPORTED_DRAFTS:
+        return None
+    gen = _Generator(schema, refs or {})
+    try:
+        name = gen.function(schema)
+    except _Unsupported:
+        return None
+    return gen.build(name)
+
+
+def generate_source(schema, refs=None):
+    """
+    Return the generated Python source for a schema, for debugging.
+    """
+    gen = _Generator(schema, refs or {})
+    gen.function(schema)
+    return '\n'.join(gen.source)
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class _Generator:
+    """
+    Accumulates the source code and namespace for the functions of one schema.
+    """
+
+    def __init__(self, root, refs):
+        self.root = root
+        self.refs = refs
+        self.source = []  # type: list
+        self.namespace = {'_in_enum': _in_enum, '_equal': _equal}  # type: dict
+        # Map $ref values to generated function names
+        self.ref_names = {}  # type: dict
+        self.counter = 0
+
+    def build(self, name):
+        exec('\n'.join(self.source), self.namespace)
+        return self.namespace[name]
+
+    def name(self, prefix):
+        self.counter += 1
+        return f'{prefix}{self.counter}'
+
+    def const(self, prefix, value):
+        """
+        Bind a value into the namespace of the generated code.
+        """
+        name = self.name(prefix)
+        self.namespace[name] = value
+        return name
+
+    def function(self, schema):
+        """
+        Generate a function for a subschema, returning its name.
+        """
+        name = self.name('_validate_')
+        if schema is self.root:
+            self.ref_names['#'] = name
+        lines = [f'def {name}(v0):']
+        self.checks(schema, 'v0', lines, 1)
+        lines.append('    return True')
+        self.source.extend(lines)
+        return name
+
+    def ref(self, ref):
+        if ref not in self.ref_names:
+            if ref not in self.refs:
+                raise _Unsupported(ref)
+            # Reserve the name first so that recursive references terminate
+            name = self.name('_validate_')
+            self.ref_names[ref] = name
+            lines = [f'def {name}(v0):']
+            self.checks(self.refs[ref], 'v0', lines, 1)
+            lines.append('    return True')
+            self.source.extend(lines)
+        return self.ref_names[ref]
+
+    def checks(self, schema, var, lines, indent):
+        """
+        Append the lines that check `var` against `schema`, returning False on failure.
+        """
+        pad = '    ' * indent
+        if schema is True:
+            return
+        if schema is False:
+            lines.append(f'{pad}return False')
+            return
+        if not isinstance(schema, dict):
+            raise _Unsupported(schema)
+        if '$ref' in schema:
+            # Other keywords are ignored next to a $ref
+            lines.append(f"{pad}if not {self.ref(schema['$ref'])}({var}):")
+            lines.append(f'{pad}    return False')
+            return
+        unsupported = _UNSUPPORTED.intersection(schema)
+        if unsupported:
+            raise _Unsupported(unsupported)
+        known = None
+        if 'type' in schema:
+            types = schema['type']
+            if isinstance(types, str):
+                types = [types]
+            if any(typ not in _TYPE_EXPRS for typ in types):
+                raise _Unsupported(types)
+            expr = ' or '.join(_TYPE_EXPRS[typ].format(v=var) for typ in types)
+            lines.append(f'{pad}if not ({expr}):')
+            lines.append(f'{pad}    return False')
+            if len(types) == 1:
+                known = types[0]
+        if 'enum' in schema:
+            enum = schema['enum']
+            if enum and all(isinstance(each, str) for each in enum):
+                name = self.const('_enum_', frozenset(enum))
+                lines.append(f'{pad}if not (isinstance({var}, str) and {var} in {name}):')
+            else:
+                name = self.const('_enum_', list(enum))
+                lines.append(f'{pad}if not _in_enum({var}, {name}):')
+            lines.append(f'{pad}    return False')
+        if 'const' in schema:
+            name = self.const('_const_', schema['const'])
+            lines.append(f'{pad}if not _equal({var}, {name}):')
+            lines.append(f'{pad}    return False')
+        self.guarded(schema, _OBJECT_KEYWORDS, _TYPE_EXPRS['object'], known == 'object',
+                     self.object_checks, var, lines, indent)
+        self.guarded(schema, _ARRAY_KEYWORDS, _TYPE_EXPRS['array'], known == 'array',
+                     self.array_checks, var, lines, indent)
+        self.guarded(schema, _NUMBER_KEYWORDS, _TYPE_EXPRS['number'], known in ('number', 'integer'),
+                     self.number_checks, var, lines, indent)
+        self.guarded(schema, _STRING_KEYWORDS, _TYPE_EXPRS['string'], known == 'string',
+                     self.string_checks, var, lines, indent)
+        for sub in schema.get('allOf', []):
+            self.checks(sub, var, lines, indent)
+        if 'anyOf' in schema:
+            calls = ' or '.join(f'{self.function(sub)}({var})' for sub in schema['anyOf'])
+            lines.append(f'{pad}if not ({calls}):')
+            lines.append(f'{pad}    return False')
+        if 'oneOf' in schema:
+            calls = ', '.join(f'{self.function(sub)}({var})' for sub in schema['oneOf'])
+            lines.append(f'{pad}if [{calls}].count(True) != 1:')
+            lines.append(f'{pad}    return False')
+        if 'not' in schema:
+            lines.append(f"{pad}if {self.function(schema['not'])}({var}):")
+            lines.append(f'{pad}    return False')
+
+    def guarded(self, schema, keywords, guard, known, gen_checks, var, lines, indent):
+        """
+        Generate type-specific checks, which only apply when the instance has that type.
+        """
+        if not any(key in schema for key in keywords):
+            return
+        if known:
+            gen_checks(schema, var, lines, indent)
+            return
+        body = []  # type: list
+        gen_checks(schema, var, body, indent + 1)
+        if body:
+            lines.append('    ' * indent + f'if {guard.format(v=var)}:')
+            lines.extend(body)
+
+    def object_checks(self, schema, var, lines, indent):
+        pad = '    ' * indent
+        for prop in schema.get('required', []):
+            lines.append(f'{pad}if {prop!r} not in {var}:')
+            lines.append(f'{pad}    return False')
+        if 'minProperties' in schema:
+            lines.append(f"{pad}if len({var}) < {schema['minProperties']!r}:")
+            lines.append(f'{pad}    return False')
+        if 'maxProperties' in schema:
+            lines.append(f"{pad}if len({var}) > {schema['maxProperties']!r}:")
+            lines.append(f'{pad}    return False')
+        props = schema.get('properties', {})
+        for (prop, sub) in props.items():
+            sub_var = self.name('v')
+            sub_lines = []
+            self.checks(sub, sub_var, sub_lines, indent + 1)
+            if sub_lines:
+                lines.append(f'{pad}if {prop!r} in {var}:')
+                lines.append(f'{pad}    {sub_var} = {var}[{prop!r}]')
+                lines.extend(sub_lines)
+        patterns = schema.get('patternProperties', {})
+        for (pattern, sub) in patterns.items():
+            (key_var, sub_var) = (self.name('k'), self.name('v'))
+            sub_lines = []
+            self.checks(sub, sub_var, sub_lines, indent + 2)
+            if sub_lines:
+                regex = self.const('_pattern_', re.compile(pattern))
+                lines.append(f'{pad}for ({key_var}, {sub_var}) in {var}.items():')
+                lines.append(f'{pad}    if {regex}.search({key_var}) is not None:')
+                lines.extend(sub_lines)
+        additional = schema.get('additionalProperties', True)
+        if additional is True:
+            return
+        names = self.const('_props_', frozenset(props))
+        if additional is False and not patterns:
+            lines.append(f'{pad}if not {var}.keys() <= {names}:')
+            lines.append(f'{pad}    return False')
+            return
+        (key_var, sub_var) = (self.name('k'), self.name('v'))
+        sub_lines = []
+        self.checks(additional, sub_var, sub_lines, indent + 2)
+        if not sub_lines:
+            return
+        condition = f'{key_var} not in {names}'
+        if patterns:
+            regex = self.const('_pattern_', re.compile('|'.join(patterns)))
+            condition += f' and {regex}.search({key_var}) is None'
+        lines.append(f'{pad}for ({key_var}, {sub_var}) in {var}.items():')
+        lines.append(f'{pad}    if {condition}:')
+        lines.extend(sub_lines)
+
+    def array_checks(self, schema, var, lines, indent):
+        pad = '    ' * indent
+        if 'minItems' in schema:
+            lines.append(f"{pad}if len({var}) < {schema['minItems']!r}:")
+            lines.append(f'{pad}    return False')
+        if 'maxItems' in schema:
+            lines.append(f"{pad}if len({var}) > {schema['maxItems']!r}:")
+            lines.append(f'{pad}    return False')
+        items = schema.get('items', True)
+        if not isinstance(items, list):
+            sub_var = self.name('v')
+            sub_lines = []
+            self.checks(items, sub_var, sub_lines, indent + 1)
+            if sub_lines:
+                lines.append(f'{pad}for {sub_var} in {var}:')
+                lines.extend(sub_lines)
+            return
+        # Tuple validation, where each position has its own schema
+        for (idx, sub) in enumerate(items):
+            sub_var = self.name('v')
+            sub_lines = []
+            self.checks(sub, sub_var, sub_lines, indent + 1)
+            if sub_lines:
+                lines.append(f'{pad}if len({var}) > {idx}:')
+                lines.append(f'{pad}    {sub_var} = {var}[{idx}]')
+                lines.extend(sub_lines)
+        additional = schema.get('additionalItems', True)
+        sub_var = self.name('v')
+        sub_lines = []
+        self.checks(additional, sub_var, sub_lines, indent + 1)
+        if sub_lines:
+            lines.append(f'{pad}for {sub_var} in {var}[{len(items)}:]:')
+            lines.extend(sub_lines)
+
+    def number_checks(self, schema, var, lines, indent):
+        pad = '    ' * indent
+        for (key, operator) in (('minimum', '<'), ('maximum', '>'),
+                                ('exclusiveMinimum', '<='), ('exclusiveMaximum', '>=')):
+            if key in schema:
+                lines.append(f'{pad}if {var} {operator} {schema[key]!r}:')
+                lines.append(f'{pad}    return False')
+
+    def string_checks(self, schema, var, lines, indent):
+        pad = '    ' * indent
+        if 'minLength' in schema:
+            lines.append(f"{pad}if len({var}) < {schema['minLength']!r}:")
+            lines.append(f'{pad}    return False')
+        if 'maxLength' in schema:
+            lines.append(f"{pad}if len({var}) > {schema['maxLength']!r}:")
+            lines.append(f'{pad}    return False')
+        if 'pattern' in schema:
+            name = self.const('_pattern_', re.compile(schema['pattern']))
+            lines.append(f'{pad}if {name}.search({var}) is None:')
+            lines.append(f'{pad}    return False')
+
+
+def _unbool(value, true=object(), false=object()):
+    """
+    Keep booleans distinct from 0 and 1 when comparing, the same as jsonschema.
+    """
+    if value is True:
+        return true
+    elif value is False:
+        return false
+    return value
+
+
+def _in_enum(value, enum):
+    if value == 0 or value == 1:
+        return any(_unbool(value) == _unbool(each) for each in enum)
+    return value in enum
+
+
+def _equal(value, const):
+    return _unbool(value) == _unbool(const)
@@ -0,0 +1,74 @@
+"""
+JSON codecs used by the server for decoding requests and encoding responses.
+"""
+import json
+
+CODECS = ('json', 'orjson', 'ujson')
+# The codecs tried by 'auto', fastest first
+_FASTEST = ('orjson', 'ujson', 'json')
+
+
+class JSONCodec:
+    """
+    A pair of functions for decoding and encoding JSON.
+
+    `loads` takes bytes or a string, and `dumps` returns compact JSON as bytes.
+    """
+
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+    def __repr__(self):
+        return f'JSONCodec({self.name!r})'
+
+
+def get_json_codec(codec='auto'):
+    """
+    Get a codec by name, or return a JSONCodec object as is. 'auto' gets the
+    fastest codec that is installed: orjson, then ujson, then the standard
+    library. Raises ImportError if the library for a codec is not installed.
+    """
+    if isinstance(codec, JSONCodec):
+        return codec
+    if codec == 'auto':
+        for name in _FASTEST:
+            try:
+                return get_json_codec(name)
+            except ImportError:
+                continue
+    if codec == 'json':
+        return JSONCodec('json', json.loads, _stdlib_dumps)
+    elif codec == 'orjson':
+        import orjson
+
+        def orjson_dumps(value):
+            # Encode keys that aren't strings, like the other codecs do
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        return JSONCodec('orjson', orjson.loads, orjson_dumps)
+    elif codec == 'ujson':
+        import ujson
+
+        def ujson_dumps(value):
+            return ujson.dumps(value, escape_forward_slashes=False).encode()
+        return JSONCodec('ujson', ujson.loads, ujson_dumps)
+    raise ValueError(f"Unknown JSON codec '{codec}'. Valid codecs are: auto, {', '.join(CODECS)}")
+
+
+def available_codecs():
+    """
+    Names of the built-in codecs that can be used in this environment.
+    """
+    names = []
+    for name in CODECS:
+        try:
+            get_json_codec(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def _stdlib_dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode()
@@ -0,0 +1,155 @@
+"""
+Non-blocking logging for the server workers.
+
+The Sanic loggers of every worker only put their records on a shared queue.
+A single listener thread in the process that starts the server formats them,
+writes them to the console and the log file, and rotates the file, so no
+file I/O ever happens on a worker's event loop, and the file is only ever
+rotated by one writer.
+"""
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import sys
+
+DEFAULT_LOG_PATH = os.path.join('tmp', 'app.log')
+
+_GENERIC_FORMAT = '%(asctime)s %(levelname)-8s %(message)s'
+_ACCESS_FORMAT = '%(asctime)s %(levelname)-8s %(host)s %(request)s %(message)s-> %(status)d'
+_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts log records on a queue without ever blocking. While the queue is
+    full, records are dropped, and the number of dropped records is logged as
+    soon as there is room again.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.dropped:
+            msg = f'Dropped {self.dropped} log records because the log queue was full'
+            warning = logging.LogRecord('sanic.error', logging.WARNING, __file__, 0, msg, None, None)
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += 1
+                return
+            self.dropped = 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Formatter(logging.Formatter):
+    """
+    Formats access log records in the access format, and any others in the
+    generic format.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.generic = logging.Formatter(_GENERIC_FORMAT, _DATE_FORMAT)
+        self.access = logging.Formatter(_ACCESS_FORMAT, _DATE_FORMAT)
+
+    def format(self, record):
+        if record.name == 'sanic.access':
+            return self.access.format(record)
+        return self.generic.format(record)
+
+
+class _LoggerFilter(logging.Filter):
+    """
+    Only passes records from the named loggers and their children.
+    """
+
+    def __init__(self, *names):
+        super().__init__()
+        self.names = names
+
+    def filter(self, record):
+        return any(record.name == name or record.name.startswith(name + '.') for name in self.names)
+
+
+class LogPipeline:
+    """
+    The log queue and its listener, which writes to the console and to a
+    rotating log file of up to `max_bytes` with `backup_count` old copies.
+
+    At most `buffer_size` records wait in the queue. When the listener can't
+    keep up, new records are dropped rather than slowing down the workers.
+
+    Create it and call `start` before the server forks its workers, configure
+    the Sanic loggers with `log_config`, and call `stop` once the server has
+    stopped to write out any remaining records.
+    """
+
+    def __init__(self, development, log_path=None, max_bytes=1048576, backup_count=3, buffer_size=10000):
+        self.level = 'DEBUG' if development else 'WARNING'
+        self.log_path = log_path or DEFAULT_LOG_PATH
+        if os.path.dirname(self.log_path):
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        self.queue = multiprocessing.Queue(buffer_size)
+        formatter = _Formatter()
+        file_handler = logging.handlers.RotatingFileHandler(
+            self.log_path, maxBytes=max_bytes, backupCount=backup_count, delay=True
+        )
+        console = logging.StreamHandler(sys.stdout)
+        console.addFilter(_LoggerFilter('sanic.root', 'sanic.access'))
+        error_console = logging.StreamHandler(sys.stderr)
+        error_console.addFilter(_LoggerFilter('sanic.error'))
+        self.handlers = (file_handler, console, error_console)
+        for handler in self.handlers:
+            handler.setFormatter(formatter)
+        self.listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+
+    def start(self):
+        self.listener.start()
+
+    def stop(self):
+        """
+        Write out the records left in the queue, and close the log file.
+        """
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def log_config(self):
+        """
+        Logging config for Sanic, sending the records of its loggers to the queue.
+        """
+        return {
+            'version': 1,
+            'disable_existing_loggers': False,
+            'loggers': {
+                "sanic.root": {
+                    "level": self.level,
+                    "handlers": ["queue"],
+                },
+                "sanic.error": {
+                    "level": self.level,
+                    "handlers": ["queue"],
+                    "propagate": True,
+                    "qualname": "sanic.error",
+                },
+                "sanic.access": {
+                    "level": self.level,
+                    "handlers": ["queue"],
+                    "propagate": True,
+                    "qualname": "sanic.access",
+                },
+            },
+            'handlers': {
+                "queue": {
+                    "()": DroppingQueueHandler,
+                    "queue": self.queue,
+                },
+            },
+        }
@@ -0,0 +1,192 @@
+"""
+Per-method call counts, error counts, latency histograms and cache hits,
+shared by all the worker processes of a server and rendered in the
+Prometheus text format.
+"""
+import bisect
+import multiprocessing
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Number of distinct JSON RPC error codes that get counters of their own. Errors
+# with any other code, or with a code that isn't an integer, are counted as "other".
+MAX_ERROR_CODES = 32
+
+# Layout of the counters for one method: calls, errors for each code in the
+# order the codes were first seen, other errors, a count for each bucket plus
+# one for +Inf, the sum of the latencies, the number of sampled results that
+# were validated and that were invalid, and the result cache hits and misses
+_ERRORS = 1
+_OTHER_ERRORS = _ERRORS + MAX_ERROR_CODES
+_BUCKETS = _OTHER_ERRORS + 1
+_SUM = _BUCKETS + len(BUCKETS) + 1
+_VALIDATED = _SUM + 1
+_VIOLATIONS = _SUM + 2
+_CACHE_HITS = _SUM + 3
+_CACHE_MISSES = _SUM + 4
+_STRIDE = _SUM + 5
+
+
+class Metrics:
+    """
+    Counters for every method of a dispatch table, in shared memory.
+
+    The memory is allocated before the server forks its workers, with one row
+    of counters per worker. Each worker calls `start_worker` to claim a row,
+    and then only ever writes to its own row from its event loop, so recording
+    needs no locks. Rendering sums the rows of all the workers.
+
+    Error codes get their counters in a table shared by the workers, the
+    first time any worker sees them. Only that lookup takes a lock, once per
+    code and worker.
+    """
+
+    def __init__(self, dispatch, workers=1):
+        self.methods = sorted(dispatch.methods.values(), key=lambda meth: meth.index)
+        self.paths = {meth.index: path for ((path, _), meth) in dispatch.methods.items()}
+        self.workers = max(workers, 1)
+        self.row_size = len(self.methods) * _STRIDE
+        self.counters = multiprocessing.RawArray('d', self.workers * self.row_size)
+        self._next_row = multiprocessing.Value('i', 0)
+        self._offset = 0
+        self.error_codes = multiprocessing.RawArray('q', MAX_ERROR_CODES)
+        self._error_code_count = multiprocessing.Value('i', 0)
+        # Counter offsets of the error codes seen by this worker
+        self._error_slots = {}  # type: dict
+
+    def start_worker(self):
+        """
+        Claim a row of counters for the current worker process.
+        """
+        with self._next_row.get_lock():
+            row = self._next_row.value % self.workers
+            self._next_row.value += 1
+        self._offset = row * self.row_size
+
+    def record(self, meth, error_code, duration):
+        """
+        Record one call to a method, given the JSON RPC code of its error, or
+        None if it succeeded, and its duration in seconds.
+        """
+        counters = self.counters
+        base = self._offset + meth.index * _STRIDE
+        counters[base] += 1
+        if error_code is not None:
+            slot = self._error_slots.get(error_code) if _is_code(error_code) else _OTHER_ERRORS
+            if slot is None:
+                slot = self._claim_error_slot(error_code)
+            counters[base + slot] += 1
+        counters[base + _BUCKETS + bisect.bisect_left(BUCKETS, duration)] += 1
+        counters[base + _SUM] += duration
+
+    def _claim_error_slot(self, code):
+        """
+        Find the counter offset of an error code in the shared table, adding
+        the code if there is room.
+        """
+        slot = _OTHER_ERRORS
+        with self._error_code_count.get_lock():
+            count = self._error_code_count.value
+            codes = self.error_codes[:count]
+            if code in codes:
+                slot = _ERRORS + codes.index(code)
+            elif count < MAX_ERROR_CODES:
+                self.error_codes[count] = code
+                self._error_code_count.value = count + 1
+                slot = _ERRORS + count
+        self._error_slots[code] = slot
+        return slot
+
+    def record_result_check(self, meth, valid):
+        """
+        Record the validation of a sampled result of a method.
+        """
+        base = self._offset + meth.index * _STRIDE
+        self.counters[base + _VALIDATED] += 1
+        if not valid:
+            self.counters[base + _VIOLATIONS] += 1
+
+    def record_cache(self, meth, hit):
+        """
+        Record a lookup in the result cache of a method.
+        """
+        self.counters[self._offset + meth.index * _STRIDE + (_CACHE_HITS if hit else _CACHE_MISSES)] += 1
+
+    def totals(self):
+        """
+        Counters of each method summed over all the workers, as a list of lists.
+        """
+        counters = self.counters[:]
+        totals = []
+        for meth in self.methods:
+            base = meth.index * _STRIDE
+            totals.append([
+                sum(counters[row * self.row_size + base + idx] for row in range(self.workers))
+                for idx in range(_STRIDE)
+            ])
+        return totals
+
+    def render(self):
+        """
+        Render all the counters in the Prometheus text exposition format.
+        """
+        (calls, errors, validated, violations, buckets, sums) = ([], [], [], [], [], [])
+        (cache_hits, cache_misses) = ([], [])
+        codes = self.error_codes[:self._error_code_count.value]
+        for (meth, counts) in zip(self.methods, self.totals()):
+            labels = f'path="{_escape(self.paths[meth.index] or "")}",method="{_escape(meth.name)}"'
+            calls.append(f'brontosaurus_calls_total{{{labels}}} {_num(counts[0])}')
+            for (idx, code) in enumerate(codes):
+                errors.append(f'brontosaurus_errors_total{{{labels},code="{code}"}} {_num(counts[_ERRORS + idx])}')
+            if counts[_OTHER_ERRORS]:
+                errors.append(f'brontosaurus_errors_total{{{labels},code="other"}} {_num(counts[_OTHER_ERRORS])}')
+            validated.append(f'brontosaurus_results_validated_total{{{labels}}} {_num(counts[_VALIDATED])}')
+            violations.append(f'brontosaurus_result_violations_total{{{labels}}} {_num(counts[_VIOLATIONS])}')
+            if meth.cache is not None:
+                cache_hits.append(f'brontosaurus_cache_hits_total{{{labels}}} {_num(counts[_CACHE_HITS])}')
+                cache_misses.append(f'brontosaurus_cache_misses_total{{{labels}}} {_num(counts[_CACHE_MISSES])}')
+            cumulative = 0.0
+            for (idx, bound) in enumerate(BUCKETS + ('+Inf',)):
+                cumulative += counts[_BUCKETS + idx]
+                buckets.append(f'brontosaurus_call_duration_seconds_bucket{{{labels},le="{bound}"}} {_num(cumulative)}')
+            sums.append(f'brontosaurus_call_duration_seconds_sum{{{labels}}} {counts[_SUM]!r}')
+            sums.append(f'brontosaurus_call_duration_seconds_count{{{labels}}} {_num(counts[0])}')
+        lines = [
+            '# HELP brontosaurus_calls_total Calls to each JSON RPC method.',
+            '# TYPE brontosaurus_calls_total counter',
+        ] + calls + [
+            '# HELP brontosaurus_errors_total Failed calls to each JSON RPC method by error code.',
+            '# TYPE brontosaurus_errors_total counter',
+        ] + errors + [
+            '# HELP brontosaurus_results_validated_total Sampled results of each JSON RPC method that were validated.',
+            '# TYPE brontosaurus_results_validated_total counter',
+        ] + validated + [
+            '# HELP brontosaurus_result_violations_total Sampled results of each JSON RPC method that were invalid.',
+            '# TYPE brontosaurus_result_violations_total counter',
+        ] + violations + [
+            '# HELP brontosaurus_cache_hits_total Calls to each cached JSON RPC method answered from its cache.',
+            '# TYPE brontosaurus_cache_hits_total counter',
+        ] + cache_hits + [
+            '# HELP brontosaurus_cache_misses_total Calls to each cached JSON RPC method not found in its cache.',
+            '# TYPE brontosaurus_cache_misses_total counter',
+        ] + cache_misses + [
+            '# HELP brontosaurus_call_duration_seconds Duration of calls to each JSON RPC method.',
+            '# TYPE brontosaurus_call_duration_seconds histogram',
+        ] + buckets + sums
+        return '\n'.join(lines) + '\n'
+
+
+def _is_code(value):
+    """
+    Can an error code be kept in the shared table of codes?
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
+
+
+def _num(value):
+    return str(int(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,138 @@
+"""
+Incrementally parse a request body that arrives in chunks, decoding the
+elements of a top-level JSON array as soon as each one is complete.
+"""
+import codecs
+import json
+
+# Parser states
+_START = 'start'
+_FIRST_VALUE = 'first_value'
+_VALUE = 'value'
+_SEPARATOR = 'separator'
+_END = 'end'
+_SINGLE = 'single'
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_END = _WHITESPACE + ',]'
+
+
+class JSONArrayParser:
+    """
+    Incremental parser for a JSON body. If the body is a top-level array, its
+    elements are returned from `feed` as soon as they have been decoded, so
+    the whole body never needs to be held in memory. Any other body is
+    buffered and decoded by `close`.
+
+    Raises ValueError for invalid JSON.
+    """
+
+    def __init__(self, loads=json.loads):
+        # Whether the body is a top-level array, or None until it is known
+        self.is_array = None
+        # Number of array elements decoded so far
+        self.count = 0
+        self._state = _START
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        # Decodes bodies that are not arrays. Array elements are always
+        # decoded with the standard library, which can find where they end.
+        self._loads = loads
+        self._json_decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        # Chunks not yet joined onto the buffer, and their total length
+        self._parts = []  # type: list
+        self._parts_len = 0
+        # Wait for this much unparsed text before retrying an incomplete element,
+        # so that a large element arriving in many chunks is not decoded
+        # over and over again
+        self._retry_at = 0
+        self._empty = True
+
+    def feed(self, data):
+        """
+        Add a chunk of the body, returning a list of the array elements that
+        have been completed by it.
+        """
+        if data:
+            self._empty = False
+        text = self._decoder.decode(data)
+        self._parts.append(text)
+        self._parts_len += len(text)
+        if self._state == _SINGLE or len(self._buf) - self._pos + self._parts_len < self._retry_at:
+            return []
+        return self._parse(final=False)
+
+    def close(self):
+        """
+        Signal the end of the body, returning the remaining array elements, or
+        a list of the single decoded value if the body is not an array.
+        """
+        self._parts.append(self._decoder.decode(b'', final=True))
+        if self._state != _SINGLE:
+            items = self._parse(final=True)
+            if self._state == _END:
+                return items
+            if self._state != _START:
+                raise ValueError('Unterminated JSON array')
+        # Not a bulk request, so decode the whole body at once
+        self.is_array = False
+        if self._empty:
+            return [None]
+        return [self._loads(self._join())]
+
+    def _join(self):
+        text = self._buf[self._pos:] + ''.join(self._parts)
+        (self._parts, self._parts_len) = ([], 0)
+        return text
+
+    def _parse(self, final):
+        buf = self._join()
+        (pos, end, items) = (0, len(buf), [])
+        self._retry_at = 0
+        while True:
+            while pos < end and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos == end:
+                break
+            if self._state == _START:
+                if buf[pos] != '[':
+                    # Keep the rest of the body for `close`
+                    self._state = _SINGLE
+                    break
+                self.is_array = True
+                self._state = _FIRST_VALUE
+                pos += 1
+            elif self._state == _FIRST_VALUE and buf[pos] == ']':
+                self._state = _END
+                pos += 1
+            elif self._state in (_FIRST_VALUE, _VALUE):
+                try:
+                    (value, value_end) = self._json_decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    self._retry_at = (end - pos) * 2
+                    break
+                # A number may continue in the next chunk until it is followed
+                # by whitespace, ',' or ']'
+                if isinstance(value, (int, float)) and not final and (
+                        value_end == end or buf[value_end] not in _NUMBER_END):
+                    self._retry_at = end - pos + 1
+                    break
+                items.append(value)
+                self.count += 1
+                self._state = _SEPARATOR
+                pos = value_end
+            elif self._state == _SEPARATOR:
+                if buf[pos] == ',':
+                    self._state = _VALUE
+                elif buf[pos] == ']':
+                    self._state = _END
+                else:
+                    raise ValueError("Expecting ',' or ']' after an array element")
+                pos += 1
+            else:
+                raise ValueError('Extra data after the JSON array')
+        (self._buf, self._pos) = (buf, pos)
+        return items
@@ -0,0 +1,182 @@
+"""
+A pool of processes for CPU-bound handlers, shared by all the server workers.
+
+Sanic starts its workers as daemonic processes, which aren't allowed to start
+processes of their own. The pool is started by the process that starts the
+server instead, and the workers reach it over queues: calls go to the pool
+on one shared queue, and each worker gets its results back on its own queue.
+
+The process that starts the pool also watches its processes. When one of
+them dies, for example when it crashes or gets killed for running out of
+memory, the call it was running fails with BrokenProcessPool, and the
+process is replaced.
+"""
+from concurrent.futures.process import BrokenProcessPool
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import threading
+
+
+class ProcessPool:
+    """
+    Runs functions in `processes` processes (defaults to the number of CPUs)
+    on behalf of up to `workers` server workers.
+
+    Create it and call `start` before the server forks its workers, call
+    `start_worker` in each worker before sending calls with `run`, and call
+    `stop` once the server has stopped.
+    """
+
+    def __init__(self, processes=None, workers=1):
+        self.size = processes or os.cpu_count() or 1
+        self.workers = max(workers, 1)
+        self.tasks = multiprocessing.Queue()
+        self.results = [multiprocessing.Queue() for _ in range(self.workers)]
+        self.processes = []  # type: list
+        # The worker index and id of the last call taken by each process, or -1
+        self.running = multiprocessing.RawArray('q', [-1] * (self.size * 2))
+        self._next_worker = multiprocessing.Value('i', 0)
+        self._lock = threading.Lock()
+        self._stopping = False
+        # State of the current worker, set by start_worker
+        self.worker = None
+        self.loop = None
+        self.futures = {}  # type: dict
+        self.call_ids = itertools.count()
+        self.reader = None
+
+    def start(self):
+        if self.processes:
+            return
+        self._stopping = False
+        self.processes = [self._spawn(idx) for idx in range(self.size)]
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        """
+        Let the processes finish their current calls, and stop them.
+        """
+        with self._lock:
+            self._stopping = True
+            processes = self.processes
+            self.processes = []
+        for _ in processes:
+            self.tasks.put(None)
+        for proc in processes:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+
+    def _spawn(self, idx):
+        self.running[idx * 2] = -1
+        proc = multiprocessing.Process(target=_run_calls, args=(self.tasks, self.results, self.running, idx),
+                                       daemon=True)
+        proc.start()
+        return proc
+
+    def _watch(self):
+        """
+        Fail the call of any process that dies, and replace the process.
+        """
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                processes = list(self.processes)
+            # Time out to notice when the pool gets stopped
+            ended = multiprocessing.connection.wait([proc.sentinel for proc in processes], timeout=1)
+            with self._lock:
+                if self._stopping:
+                    return
+                for (idx, proc) in enumerate(processes):
+                    if proc.sentinel in ended:
+                        proc.join()
+                        self._fail_running(idx, proc.exitcode)
+                        self.processes[idx] = self._spawn(idx)
+
+    def _fail_running(self, idx, exitcode):
+        (worker, call_id) = (self.running[idx * 2], self.running[idx * 2 + 1])
+        if worker < 0:
+            return
+        err = BrokenProcessPool(f"A pool process exited with code {exitcode} while running the call")
+        self.results[worker].put((call_id, False, pickle.dumps(err)))
+
+    def start_worker(self, loop):
+        """
+        Claim a results queue for the current worker process, and start
+        reading the results for its event loop.
+        """
+        with self._next_worker.get_lock():
+            self.worker = self._next_worker.value % self.workers
+            self._next_worker.value += 1
+        self.loop = loop
+        self.reader = threading.Thread(target=self._read_results, args=(self.results[self.worker],), daemon=True)
+        self.reader.start()
+
+    def stop_worker(self):
+        self.results[self.worker].put(None)
+        self.reader.join()
+
+    def run(self, func, *args):
+        """
+        Call a function with args in the pool, returning a future of its result.
+        """
+        # Pickle here rather than in the queue's feeder thread, so errors reach the caller
+        task = pickle.dumps((func, args))
+        call_id = next(self.call_ids)
+        future = self.loop.create_future()
+        self.futures[call_id] = future
+        self.tasks.put((self.worker, call_id, task))
+        return future
+
+    def _read_results(self, results):
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            self.loop.call_soon_threadsafe(self._set_result, *item)
+
+    def _set_result(self, call_id, ok, data):
+        # A call may be failed by a process that died after sending its result
+        future = self.futures.pop(call_id, None)
+        if future is None or future.cancelled():
+            return
+        try:
+            value = pickle.loads(data)
+        except Exception as err:
+            future.set_exception(err)
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+
+def _run_calls(tasks, results, running, idx):
+    """
+    Run calls from the tasks queue in the pool process at `idx`, until given None.
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        (worker, call_id, data) = task
+        # Left in place after the result is sent, as the process may die before it is flushed
+        running[idx * 2 + 1] = call_id
+        running[idx * 2] = worker
+        try:
+            (func, args) = pickle.loads(data)
+            (ok, value) = (True, func(*args))
+        except Exception as err:
+            (ok, value) = (False, err)
+        except BaseException as err:
+            # Such as SystemExit, which would also stop the server worker awaiting the result
+            (ok, value) = (False, RuntimeError(f"{type(err).__name__} raised: {err}"))
+        try:
+            result = pickle.dumps(value)
+        except Exception as err:
+            (ok, result) = (False, pickle.dumps(TypeError(f"Result could not be pickled: {err}")))
+        results[worker].put((call_id, ok, result))
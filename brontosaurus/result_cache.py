@@ -0,0 +1,71 @@
+"""
+In-memory cache of method results, with LRU eviction and an optional TTL.
+"""
+import collections
+import json
+import time
+
+# Returned by `ResultCache.get` when there is no usable entry
+MISSING = object()
+
+
+def make_key(params, headers, header_names=()):
+    """
+    Create a canonical key for some validated params and the values of the
+    named request headers.
+    """
+    key = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    if header_names:
+        return (key, tuple(headers.get(name) for name in header_names))
+    return key
+
+
+class ResultCache:
+    """
+    LRU cache of results for one method, keyed on the params and optionally
+    some of the request headers. Each server worker has its own copy.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, headers=()):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.headers = tuple(headers)
+        self.hits = 0
+        self.misses = 0
+        # Map keys to pairs of (expiration time, result), in least to most recently used order
+        self.entries = collections.OrderedDict()  # type: collections.OrderedDict
+
+    def get(self, key):
+        """
+        Get a cached result, or MISSING if there is none or it has expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        (expires, result) = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return MISSING
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def set(self, key, result):
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        self.entries[key] = (expires, result)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+        }
@@ -0,0 +1,89 @@
+"""
+Iterate over the items of a generator returned by a method handler, so that
+large results can be streamed instead of built up in memory.
+"""
+import asyncio
+import inspect
+
+from brontosaurus.compile_validators import validate
+
+
+def is_stream(result):
+    """
+    Is a handler result a sync or async generator?
+    """
+    return inspect.isgenerator(result) or inspect.isasyncgen(result)
+
+
+class ResultStream:
+    """
+    Asynchronous iterator over the items of a sync or async generator.
+
+    Items of a sync generator are pulled in batches in the `executor` thread
+    pool (or directly on the event loop if no executor is given), so a slow
+    generator doesn't block the event loop. If an `item_validator` is given,
+    each item is validated as it is produced.
+    """
+
+    def __init__(self, items, executor=None, item_validator=None, batch_size=100):
+        self.items = items
+        self.executor = executor
+        self.item_validator = item_validator
+        self.batch_size = batch_size
+        # The batch being pulled in the executor, if any
+        self.pending = None
+
+    async def __aiter__(self):
+        try:
+            if inspect.isasyncgen(self.items):
+                async for item in self.items:
+                    self._check(item)
+                    yield item
+                return
+            loop = asyncio.get_event_loop()
+            while True:
+                if self.executor is None:
+                    batch = _next_batch(self.items, self.batch_size)
+                else:
+                    self.pending = self.executor.submit(_next_batch, self.items, self.batch_size)
+                    batch = await asyncio.wrap_future(self.pending, loop=loop)
+                    self.pending = None
+                for item in batch:
+                    self._check(item)
+                    yield item
+                if len(batch) < self.batch_size:
+                    return
+        finally:
+            await self.close()
+
+    async def collect(self):
+        """
+        Get all the items as a list.
+        """
+        return [item async for item in self]
+
+    async def close(self):
+        if inspect.isasyncgen(self.items):
+            await self.items.aclose()
+        elif self.pending is not None and not self.pending.done():
+            # Cancelled while the generator runs in the executor, which can't
+            # be interrupted, so close it once the batch is done
+            self.pending.add_done_callback(lambda _: self.items.close())
+        else:
+            self.items.close()
+
+    def _check(self, item):
+        if self.item_validator is not None:
+            validate(self.item_validator, item)
+
+
+def _next_batch(items, size):
+    """
+    Pull up to `size` items from a sync generator.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            break
+    return batch
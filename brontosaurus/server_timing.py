@@ -0,0 +1,53 @@
+"""
+Time the phases of handling a request, such as params validation and running
+the handler, for the `Server-Timing` response header.
+"""
+import time
+
+
+class PhaseTimer:
+    """
+    Adds the time since the previous lap to the total of a phase in `timings`,
+    a dict of phase names to seconds. The items of a bulk request each get a
+    timer, sharing one dict, so each phase is summed over the whole batch.
+    """
+
+    __slots__ = ('timings', 'start', 'mark')
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.start = self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self.mark
+        self.mark = now
+
+
+class _NoTimer:
+    """
+    Stands in for a PhaseTimer when timings are not wanted.
+    """
+
+    __slots__ = ()
+    timings = None
+
+    def lap(self, phase):
+        pass
+
+
+NO_TIMER = _NoTimer()
+
+
+def start_timer(timings):
+    """
+    Get a timer for adding to `timings`, or one that does nothing if it is None.
+    """
+    return NO_TIMER if timings is None else PhaseTimer(timings)
+
+
+def format_timings(timings):
+    """
+    Format timings as the value of a Server-Timing header, in milliseconds.
+    """
+    return ', '.join(f'{phase};dur={seconds * 1000:.3f}' for (phase, seconds) in timings.items())
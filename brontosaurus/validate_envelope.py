@@ -0,0 +1,89 @@
+"""
+Validate the JSON RPC 2.0 envelope of a request.
+
+This is a hand-written equivalent of validating the request against
+`json_rpc2_schema` with jsonschema, costing only a few dict lookups. It raises
+the same errors (message, instance and path) that `jsonschema.validate` would.
+"""
+import jsonschema.exceptions
+
+# A forgiving JSON Schema for JSON RPC 2.0. Does not require the "jsonrpc" or
+# "id" fields.
+json_rpc2_schema = {
+    'type': 'object',
+    'required': ['method'],
+    'properties': {
+        'method': {
+            'type': 'string'
+        },
+        'id': {
+            'type': ['integer', 'string', 'number', 'null']
+        },
+        'params': {
+            'type': ['array', 'object']
+        },
+        'jsonrpc': {
+            'const': '2.0'
+        }
+    }
+}
+
+_props = json_rpc2_schema['properties']
+
+
+def validate_envelope(req_json):
+    """
+    Validate a JSON RPC 2.0 request object.
+    Raises a `jsonschema.exceptions.ValidationError` if it is invalid.
+    """
+    if not isinstance(req_json, dict):
+        raise _type_error(req_json, json_rpc2_schema, [])
+    if 'method' not in req_json:
+        raise jsonschema.exceptions.ValidationError(
+            "'method' is a required property",
+            validator='required',
+            validator_value=json_rpc2_schema['required'],
+            instance=req_json,
+            schema=json_rpc2_schema,
+        )
+    # Check the properties in the same order as the schema
+    method = req_json['method']
+    if not isinstance(method, str):
+        raise _type_error(method, _props['method'], ['method'])
+    if 'id' in req_json:
+        _id = req_json['id']
+        if not (_id is None or isinstance(_id, str) or _is_number(_id)):
+            raise _type_error(_id, _props['id'], ['id'])
+    if 'params' in req_json:
+        params = req_json['params']
+        if not isinstance(params, (list, dict)):
+            raise _type_error(params, _props['params'], ['params'])
+    if 'jsonrpc' in req_json:
+        jsonrpc = req_json['jsonrpc']
+        if not (isinstance(jsonrpc, str) and jsonrpc == '2.0'):
+            raise jsonschema.exceptions.ValidationError(
+                "'2.0' was expected",
+                validator='const',
+                validator_value='2.0',
+                instance=jsonrpc,
+                schema=_props['jsonrpc'],
+                path=['jsonrpc'],
+            )
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _type_error(instance, schema, path):
+    types = schema['type']
+    if isinstance(types, str):
+        types = [types]
+    return jsonschema.exceptions.ValidationError(
+        f"{instance!r} is not of type {', '.join(repr(typ) for typ in types)}",
+        validator='type',
+        validator_value=schema['type'],
+        instance=instance,
+        schema=schema,
+        path=path,
+    )
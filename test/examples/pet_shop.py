@@ -257,7 +257,7 @@ def delete_pet(params, headers):
 statuses = {
     'type': 'object',
     'additionalProperties': False,
-    'required': 'any_status',
+    'required': ['any_status'],
     'properties': {
         'any_status': {
             'type': 'array',
@@ -284,7 +284,7 @@ def find_pet_by_status(params, headers):
 tag_query = {
     'type': 'object',
     'additionalProperties': False,
-    'required': 'any_tag',
+    'required': ['any_tag'],
     'properties': {
         'any_tag': {
             'type': 'array',
@@ -435,7 +435,7 @@ login_params = {
             'minLength': 3
         },
         'password': {
-            'type': 'password',
+            'type': 'string',
             'minLength': 7
         }
     }
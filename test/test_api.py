@@ -1,3 +1,4 @@
+import asyncio
 import multiprocessing
 from brontosaurus import API, logger
 import requests
@@ -7,12 +8,14 @@ from uuid import uuid4
 
 _URL = 'http://localhost:8080'
 _URL_CORS = 'http://localhost:8088'
+_URL_STREAM = 'http://localhost:8089'
+_URL_WORKERS = 'http://localhost:8090'
 
 desc = """
 This is a server for running tests on brontosaurus.
 """
 
-api = API('Test Server', desc)
+api = API('Test Server', desc, max_batch_size=100, max_batch_concurrency=10)
 
 message = {
     '$id': '#message',
@@ -38,6 +41,69 @@ def echo(params, headers):
     return {'message': params['message'] * 10}
 
 
+@api.method('async_echo', 'Echo using an async handler')
+@api.params(message)
+@api.result(message)
+async def async_echo(params, headers):
+    await asyncio.sleep(0.01)
+    return {'message': params['message'] * 2}
+
+
+class CustomError(Exception):
+    error_code = -32099
+
+
+@api.method('custom_error', 'Fail with a custom JSON RPC error code')
+def custom_error(params, headers):
+    raise CustomError('Custom failure')
+
+
+@api.method('cpu_sum', 'Sum a range of numbers in a separate process')
+@api.cpu_bound
+def cpu_sum(params, headers):
+    if params['n'] < 0:
+        raise ValueError('n must not be negative')
+    return sum(range(params['n']))
+
+
+_cached_calls = {'count': 0}
+
+
+@api.method('cached_counter', 'Count the number of times the handler actually ran')
+@api.params({'type': 'object'})
+@api.cache(maxsize=10)
+@api.inline
+def cached_counter(params, headers):
+    _cached_calls['count'] += 1
+    return _cached_calls['count']
+
+
+_coalesced_calls = {'count': 0}
+
+
+@api.method('coalesced_counter', 'Slowly count the number of times the handler actually ran')
+@api.coalesce()
+async def coalesced_counter(params, headers):
+    _coalesced_calls['count'] += 1
+    count = _coalesced_calls['count']
+    await asyncio.sleep(0.2)
+    return count
+
+
+@api.method('stream_numbers', 'Stream a range of numbers from a generator')
+@api.result({'type': 'array', 'items': {'type': 'integer'}})
+def stream_numbers(params, headers):
+    for num in range(params['n']):
+        yield num
+
+
+@api.method('async_stream', 'Stream objects from an async generator')
+async def async_stream(params, headers):
+    for num in range(params['n']):
+        await asyncio.sleep(0)
+        yield {'num': num}
+
+
 @api.method('invalid_result', 'Test a result that fails schema check')
 @api.params(message)
 @api.result(message)
@@ -47,21 +113,40 @@ def invalid_result(params, headers):
 
 @api.method('require_header', 'Test the header decorator')
 @api.require_header('custom', r'xyz[0-9]+')
+@api.inline
 def header_format(params, headers):
     return headers['custom']
 
 
+@api.method('defaults', 'Test filling in defaults')
+@api.params({
+    'type': 'object',
+    'properties': {
+        'limit': {'type': 'integer', 'default': 10},
+        'filter': {'type': 'object', 'properties': {'status': {'type': 'string', 'default': 'available'}}},
+    }
+})
+@api.result({'type': 'object', 'properties': {'params': {}, 'page': {'type': 'integer', 'default': 1}}})
+@api.inline
+def defaults(params, headers):
+    return {'params': params}
+
+
+@api.method('any_header', 'Test a required header without a format')
+@api.require_header('X-Any')
+@api.inline
+def any_header(params, headers):
+    return headers['x-any']
+
+
 def _wait_for_service():
     while True:
         try:
-            requests.post(
-                _URL,
-                data=json.dumps({'method': 'echo', 'params': {'message': 'x'}})
-            ).raise_for_status()
-            requests.post(
-                _URL_CORS,
-                data=json.dumps({'method': 'echo', 'params': {'message': 'x'}})
-            ).raise_for_status()
+            for url in (_URL, _URL_CORS, _URL_STREAM, _URL_WORKERS):
+                requests.post(
+                    url,
+                    data=json.dumps({'method': 'echo', 'params': {'message': 'x'}})
+                ).raise_for_status()
             break
         except Exception:
             print('Waiting for API to start..')
@@ -69,16 +154,31 @@ def _wait_for_service():
     print('API started!')
 
 
+_servers = []
+
+
 def setup_module(module):
-    kwargs = {'workers': 1, 'port': 8080}
-    proc = multiprocessing.Process(target=api.run, kwargs=kwargs, daemon=True)
-    proc.start()
-    kwargs_cors = {'workers': 1, 'cors': True, 'port': 8088}
-    proc_cors = multiprocessing.Process(target=api.run, kwargs=kwargs_cors, daemon=True)
-    proc_cors.start()
+    all_kwargs = [
+        {'workers': 1, 'port': 8080, 'max_bulk_in_flight': 20, 'metrics_path': '/metrics'},
+        {'workers': 1, 'cors': True, 'port': 8088},
+        {'workers': 1, 'port': 8089, 'stream_requests': True},
+        {'workers': 2, 'port': 8090},
+    ]
+    for kwargs in all_kwargs:
+        # Not daemonic, as servers start the process pool for CPU-bound methods
+        proc = multiprocessing.Process(target=api.run, kwargs=kwargs)
+        proc.start()
+        _servers.append(proc)
     _wait_for_service()
 
 
+def teardown_module(module):
+    for proc in _servers:
+        proc.terminate()
+    for proc in _servers:
+        proc.join()
+
+
 def test_valid_request():
     """
     Basic happy path
@@ -353,6 +453,232 @@ def test_valid_bulk_request():
     assert resp.json() == expected
 
 
+def test_async_request():
+    """
+    Happy path for a method with an async handler
+    """
+    resp = requests.post(
+        _URL,
+        data=json.dumps({'id': 1, 'method': 'async_echo', 'params': {'message': 'hi'}})
+    )
+    assert resp.ok, resp.text
+    assert resp.json() == {'jsonrpc': '2.0', 'id': 1, 'result': {'message': 'hihi'}}
+
+
+def test_async_bulk_request():
+    """
+    Bulk request mixing sync and async handlers
+    """
+    resp = requests.post(
+        _URL,
+        data=json.dumps([
+            {'id': 1, 'method': 'async_echo', 'params': {'message': 'a'}},
+            {'id': 2, 'method': 'echo', 'params': {'message': 'b'}},
+            {'id': 3, 'method': 'async_echo', 'params': {'message': 123}},
+        ])
+    )
+    assert resp.ok, resp.text
+    results = {each['id']: each for each in resp.json()}
+    assert results[1]['result'] == {'message': 'aa'}
+    assert results[2]['result'] == {'message': 'b' * 10}
+    assert results[3]['error']['code'] == -32602
+
+
+def test_bulk_request_order():
+    """
+    Bulk responses come back in the same order as the request items
+    """
+    items = [
+        {'id': idx, 'method': 'async_echo' if idx % 2 else 'echo', 'params': {'message': str(idx)}}
+        for idx in range(50)
+    ]
+    resp = requests.post(_URL, data=json.dumps(items))
+    assert resp.ok, resp.text
+    assert [each['id'] for each in resp.json()] == list(range(50))
+
+
+def test_ndjson_bulk_request():
+    """
+    Bulk responses are streamed one per line, in completion order
+    """
+    items = [
+        {'id': idx, 'method': 'async_echo' if idx % 2 else 'echo', 'params': {'message': str(idx)}}
+        for idx in range(50)
+    ]
+    items.append({'id': 50, 'method': 'xyz'})
+    resp = requests.post(_URL, data=json.dumps(items), headers={'Accept': 'application/x-ndjson'})
+    assert resp.ok, resp.text
+    assert resp.headers['Content-Type'] == 'application/x-ndjson'
+    lines = resp.text.splitlines()
+    results = {each['id']: each for each in map(json.loads, lines)}
+    assert len(lines) == 51
+    # echo repeats the message 10 times, and async_echo twice
+    assert all(results[idx]['result'] == {'message': str(idx) * (2 if idx % 2 else 10)} for idx in range(50))
+    assert results[50]['error']['code'] == -32601
+
+
+def test_streamed_request_body():
+    """
+    Request bodies read in chunks, when the server streams requests
+    """
+    items = [{'id': idx, 'method': 'echo', 'params': {'message': str(idx)}} for idx in range(50)]
+
+    def chunks(body):
+        for idx in range(0, len(body), 7):
+            yield body[idx:idx + 7]
+    body = json.dumps(items).encode()
+    resp = requests.post(_URL_STREAM, data=chunks(body))
+    assert resp.ok, resp.text
+    assert [each['result'] for each in resp.json()] == [{'message': str(idx) * 10} for idx in range(50)]
+    resp = requests.post(_URL_STREAM, data=chunks(body), headers={'Accept': 'application/x-ndjson'})
+    assert resp.ok, resp.text
+    assert sorted(json.loads(line)['id'] for line in resp.text.splitlines()) == list(range(50))
+    resp = requests.post(_URL_STREAM, data=json.dumps(items[0]))
+    assert resp.json() == {'jsonrpc': '2.0', 'id': 0, 'result': {'message': '0' * 10}}
+    resp = requests.post(_URL_STREAM, data=body[:-1])
+    assert resp.status_code == 400
+    assert resp.json()['error'] == {'code': -32700, 'message': 'Failed when parsing body as json'}
+    resp = requests.post(_URL_STREAM, data=json.dumps(items * 3))
+    assert resp.status_code == 400
+    assert resp.json()['error']['message'] == 'Batch too large: more than 100 items given, but the maximum is 100'
+
+
+def test_streamed_request_body_order():
+    """
+    Chunks of streamed bodies stay in order, even when they arrive faster than they are parsed
+    """
+    items = [{'id': idx, 'method': 'echo', 'params': {'message': f'{idx:03}' * 5}} for idx in range(100)]
+    body = json.dumps(items).encode()
+    for _ in range(5):
+        resp = requests.post(_URL_STREAM, data=(body[idx:idx + 7] for idx in range(0, len(body), 7)))
+        assert resp.ok, resp.text
+        assert [each['result']['message'] for each in resp.json()] == [f'{idx:03}' * 50 for idx in range(100)]
+
+
+def test_streamed_batch_too_large():
+    """
+    No handler runs for a streamed batch that is too large
+    """
+    def count(label):
+        resp = requests.post(_URL_STREAM, data=json.dumps({'method': 'cached_counter', 'params': {'label': label}}))
+        assert resp.ok, resp.text
+        return resp.json()['result']
+    before = count('before')
+    items = [{'id': idx, 'method': 'cached_counter', 'params': {'label': idx}} for idx in range(101)]
+    body = json.dumps(items).encode()
+    resp = requests.post(_URL_STREAM, data=(body[idx:idx + 50] for idx in range(0, len(body), 50)))
+    assert resp.status_code == 400
+    assert resp.json()['error']['code'] == -32600
+    assert count('after') == before + 1
+
+
+def test_cpu_bound_request():
+    """
+    Methods that run in the process pool, including errors
+    """
+    resp = requests.post(
+        _URL,
+        data=json.dumps([
+            {'id': 1, 'method': 'cpu_sum', 'params': {'n': 10}},
+            {'id': 2, 'method': 'cpu_sum', 'params': {'n': -1}},
+        ])
+    )
+    assert resp.ok, resp.text
+    (ok, err) = resp.json()
+    assert ok == {'jsonrpc': '2.0', 'id': 1, 'result': 45}
+    assert err['error'] == {'code': -32000, 'message': 'n must not be negative'}
+
+
+def test_cpu_bound_request_multiple_workers():
+    """
+    The process pool is shared by all the workers of a server
+    """
+    for _ in range(4):
+        resp = requests.post(
+            _URL_WORKERS,
+            data=json.dumps([{'id': n, 'method': 'cpu_sum', 'params': {'n': n}} for n in range(10)])
+        )
+        assert resp.ok, resp.text
+        assert resp.json() == [{'jsonrpc': '2.0', 'id': n, 'result': sum(range(n))} for n in range(10)]
+
+
+def test_cached_method():
+    """
+    Identical params return the cached result without running the handler
+    """
+    def call(params):
+        resp = requests.post(_URL, data=json.dumps({'method': 'cached_counter', 'params': params}))
+        assert resp.ok, resp.text
+        return resp.json()['result']
+    hits = _metric('brontosaurus_cache_hits_total{path="",method="cached_counter"}')
+    misses = _metric('brontosaurus_cache_misses_total{path="",method="cached_counter"}')
+    first = call({'x': 1, 'y': 2})
+    assert call({'y': 2, 'x': 1}) == first
+    assert call({'x': 2}) == first + 1
+    # The metrics count the cache hits and misses of all the workers
+    assert _metric('brontosaurus_cache_hits_total{path="",method="cached_counter"}') == hits + 1
+    assert _metric('brontosaurus_cache_misses_total{path="",method="cached_counter"}') == misses + 2
+
+
+def test_coalesced_method():
+    """
+    Identical calls in flight at the same time share one execution
+    """
+    items = [{'id': idx, 'method': 'coalesced_counter', 'params': {'x': 1}} for idx in range(5)]
+    resp = requests.post(_URL, data=json.dumps(items))
+    assert resp.ok, resp.text
+    results = resp.json()
+    assert [each['id'] for each in results] == list(range(5))
+    assert len(set(each['result'] for each in results)) == 1
+    # Calls that are no longer in flight run the handler again
+    resp = requests.post(_URL, data=json.dumps(items[0]))
+    assert resp.json()['result'] == results[0]['result'] + 1
+
+
+def test_streamed_result():
+    """
+    Results of generator handlers are streamed with chunked encoding
+    """
+    resp = requests.post(_URL, data=json.dumps({'id': 1, 'method': 'stream_numbers', 'params': {'n': 20000}}))
+    assert resp.ok, resp.text
+    assert resp.headers['Transfer-Encoding'] == 'chunked'
+    assert resp.json() == {'jsonrpc': '2.0', 'id': 1, 'result': list(range(20000))}
+    resp = requests.post(_URL, data=json.dumps({'id': 2, 'method': 'async_stream', 'params': {'n': 3}}))
+    assert resp.ok, resp.text
+    assert resp.json() == {'jsonrpc': '2.0', 'id': 2, 'result': [{'num': 0}, {'num': 1}, {'num': 2}]}
+
+
+def test_streamed_result_bulk():
+    """
+    Results of generator handlers are collected into arrays in bulk requests
+    """
+    resp = requests.post(_URL, data=json.dumps([
+        {'id': 1, 'method': 'stream_numbers', 'params': {'n': 3}},
+        {'id': 2, 'method': 'async_stream', 'params': {'n': 1}},
+    ]))
+    assert resp.ok, resp.text
+    assert [each['result'] for each in resp.json()] == [[0, 1, 2], [{'num': 0}]]
+
+
+def test_bulk_request_too_large():
+    """
+    Bulk requests over the maximum batch size are rejected
+    """
+    items = [{'id': idx, 'method': 'echo', 'params': {'message': 'x'}} for idx in range(101)]
+    resp = requests.post(_URL, data=json.dumps(items))
+    assert resp.status_code == 400
+    expected = {
+        "jsonrpc": "2.0",
+        "id": None,
+        "error": {
+            "code": -32600,
+            "message": "Batch too large: 101 items given, but the maximum is 100",
+            "data": {"max_batch_size": 100}
+        }
+    }
+    assert resp.json() == expected
+
+
 def test_header_validation_valid():
     resp = requests.post(
         _URL,
@@ -393,6 +719,86 @@ def test_header_validation_missing_key():
     assert err['error'] == "Header with key 'custom' required but not provided."
 
 
+def _metric(name):
+    resp = requests.get(_URL + '/metrics')
+    assert resp.ok, resp.text
+    assert resp.headers['Content-Type'].startswith('text/plain')
+    for line in resp.text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.split(' ')[1])
+    # Error codes only show up once they have been seen
+    return 0.0
+
+
+def test_metrics():
+    calls = _metric('brontosaurus_calls_total{path="",method="echo"}')
+    errors = _metric('brontosaurus_errors_total{path="",method="echo",code="-32602"}')
+    requests.post(_URL, data=json.dumps({'method': 'echo', 'params': {'message': 'x'}}))
+    requests.post(_URL, data=json.dumps({'method': 'echo', 'params': {'message': 1}}))
+    assert _metric('brontosaurus_calls_total{path="",method="echo"}') == calls + 2
+    assert _metric('brontosaurus_errors_total{path="",method="echo",code="-32602"}') == errors + 1
+    count = _metric('brontosaurus_call_duration_seconds_count{path="",method="echo"}')
+    assert _metric('brontosaurus_call_duration_seconds_bucket{path="",method="echo",le="+Inf"}') == count
+
+
+def test_metrics_error_codes():
+    """
+    Errors are counted by the JSON RPC code the client got
+    """
+    resp = requests.post(_URL, data=json.dumps({'method': 'custom_error'}))
+    assert resp.json()['error'] == {'code': -32099, 'message': 'Custom failure'}
+    assert _metric('brontosaurus_errors_total{path="",method="custom_error",code="-32099"}') == 1
+    assert _metric('brontosaurus_errors_total{path="",method="custom_error",code="-32000"}') == 0
+
+
+def _timings(resp):
+    return dict(
+        (phase.split(';dur=')[0], float(phase.split(';dur=')[1]))
+        for phase in resp.headers['Server-Timing'].split(', ')
+    )
+
+
+def test_server_timing():
+    resp = requests.post(_URL, data=json.dumps({'method': 'echo', 'params': {'message': 'x'}}))
+    timings = _timings(resp)
+    assert list(timings) == ['parse', 'envelope', 'headers', 'params', 'handler', 'result', 'encode', 'total']
+    assert timings['total'] >= timings['handler']
+
+
+def test_server_timing_bulk():
+    items = [{'id': idx, 'method': 'echo', 'params': {'message': 'x'}} for idx in range(5)]
+    resp = requests.post(_URL, data=json.dumps(items))
+    timings = _timings(resp)
+    assert 'params' in timings and 'handler' in timings
+
+
+def test_defaults():
+    resp = requests.post(_URL, data=json.dumps({'method': 'defaults', 'params': {'filter': {}}}))
+    assert resp.ok, resp.text
+    assert resp.json()['result'] == {'params': {'limit': 10, 'filter': {'status': 'available'}}, 'page': 1}
+
+
+def test_header_without_format():
+    resp = requests.post(_URL, data=json.dumps({'method': 'any_header'}), headers={'x-any': 'value'})
+    assert resp.ok, resp.text
+    assert resp.json()['result'] == 'value'
+
+
+def test_header_names_case_insensitive():
+    resp = requests.post(_URL, data=json.dumps({'method': 'require_header'}), headers={'CUSTOM': 'xyz1'})
+    assert resp.ok, resp.text
+    assert resp.json()['result'] == 'xyz1'
+
+
+def test_header_validation_bulk():
+    items = [{'id': 1, 'method': 'require_header'}, {'id': 2, 'method': 'any_header'}]
+    resp = requests.post(_URL, data=json.dumps(items), headers={'Custom': 'xyz9'})
+    assert resp.ok, resp.text
+    (first, second) = resp.json()
+    assert first['result'] == 'xyz9'
+    assert second['error']['error'] == "Header with key 'X-Any' required but not provided."
+
+
 def test_no_cors_default_headers():
     req_id = str(uuid4())
     resp = requests.post(
@@ -412,7 +818,11 @@ def test_no_cors_default_headers():
         'Content-Length': '105',
         'Content-Type': 'application/json'
     }
-    assert resp.headers == expected
+    # The test servers run in development mode, which times every response
+    headers = dict(resp.headers)
+    assert 'Server-Timing' in headers
+    del headers['Server-Timing']
+    assert headers == expected
 
 
 def test_cors_headers():
@@ -437,4 +847,8 @@ def test_cors_headers():
         'Content-Length': '105',
         'Content-Type': 'application/json'
     }
-    assert resp.headers == expected
+    # The test servers run in development mode, which times every response
+    headers = dict(resp.headers)
+    assert 'Server-Timing' in headers
+    del headers['Server-Timing']
+    assert headers == expected
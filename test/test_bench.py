@@ -0,0 +1,65 @@
+import asyncio
+
+from brontosaurus.bench import percentile, run_scenario, summarize
+
+_PORT = 8197
+
+
+async def _serve(reader, writer):
+    """
+    Reply to each request with its body, chunked when the path is /chunked.
+    """
+    try:
+        while True:
+            head = (await reader.readuntil(b'\r\n\r\n')).decode()
+            length = int(head.lower().split('content-length:')[1].split('\r\n')[0])
+            body = await reader.readexactly(length)
+            if head.startswith('POST /chunked'):
+                writer.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n')
+                writer.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(body), body))
+            else:
+                writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+    except asyncio.IncompleteReadError:
+        writer.close()
+
+
+def _run(path, requests, concurrency):
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(_serve, '127.0.0.1', _PORT))
+    try:
+        return loop.run_until_complete(run_scenario('127.0.0.1', _PORT, path, b'{"x":1}', requests, concurrency))
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+def test_percentile():
+    values = list(range(1, 1001))
+    assert percentile(values, 50) == 500
+    assert percentile(values, 99) == 990
+    assert percentile(values, 99.9) == 999
+    assert percentile([7], 99.9) == 7
+    assert percentile([], 50) is None
+
+
+def test_run_scenario():
+    (latencies, statuses, duration) = _run('/', 50, 4)
+    assert len(latencies) == 50
+    assert statuses == {400: 50}
+    assert duration > 0
+
+
+def test_run_scenario_chunked():
+    (latencies, statuses, duration) = _run('/chunked', 10, 20)
+    assert statuses == {200: 10}
+
+
+def test_summarize():
+    summary = summarize([0.002, 0.001, 0.003], {200: 3}, 0.5, items=10)
+    assert summary['requests'] == 3
+    assert summary['statuses'] == {'200': 3}
+    assert summary['requests_per_s'] == 6
+    assert summary['items_per_s'] == 60
+    assert summary['latency_ms']['p50'] == 2
+    assert summary['latency_ms']['max'] == 3
@@ -0,0 +1,137 @@
+from brontosaurus.compile_defaults import apply_defaults, compile_defaults
+
+_REFS = {
+    '#tag': {
+        '$id': '#tag',
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string'},
+            'color': {'type': 'string', 'default': 'grey'},
+        },
+    },
+    '#order': {
+        '$id': '#order',
+        'type': 'string',
+        'enum': ['asc', 'desc'],
+        'default': 'asc',
+    },
+    '#sort': {'$ref': '#order'},
+    '#page': {
+        '$id': '#page',
+        'type': 'object',
+        'default': {},
+        'properties': {
+            'size': {'type': 'integer', 'default': 20},
+            'order': {'$ref': '#order'},
+        },
+    },
+    '#tree': {
+        '$id': '#tree',
+        'type': 'object',
+        'properties': {
+            'label': {'type': 'string', 'default': ''},
+            'children': {'type': 'array', 'items': {'$ref': '#tree'}},
+        },
+    },
+}
+
+
+def _fill(schema, instance):
+    plan = compile_defaults(schema, _REFS)
+    apply_defaults(plan, instance)
+    return instance
+
+
+def test_no_defaults():
+    assert compile_defaults({'type': 'object', 'properties': {'x': {'type': 'string'}}}, _REFS) is None
+    assert compile_defaults({'$ref': '#missing'}, _REFS) is None
+    assert compile_defaults(True, _REFS) is None
+
+
+def test_properties():
+    schema = {
+        'type': 'object',
+        'properties': {
+            'limit': {'type': 'integer', 'default': 10},
+            'sort': {'type': 'string', 'default': 'asc'},
+        },
+    }
+    assert _fill(schema, {}) == {'limit': 10, 'sort': 'asc'}
+    assert _fill(schema, {'limit': 1}) == {'limit': 1, 'sort': 'asc'}
+    # Explicit nulls are kept
+    assert _fill(schema, {'sort': None}) == {'limit': 10, 'sort': None}
+
+
+def test_nested_and_refs():
+    schema = {
+        'type': 'object',
+        'properties': {
+            'options': {
+                'type': 'object',
+                'default': {},
+                'properties': {'verbose': {'type': 'boolean', 'default': False}},
+            },
+            'tags': {'type': 'array', 'items': {'$ref': '#tag'}},
+            'main_tag': {'$ref': '#tag'},
+        },
+    }
+    params = _fill(schema, {'tags': [{'name': 'a'}, {'name': 'b', 'color': 'red'}, 'c'], 'main_tag': {}})
+    assert params == {
+        'options': {'verbose': False},
+        'tags': [{'name': 'a', 'color': 'grey'}, {'name': 'b', 'color': 'red'}, 'c'],
+        'main_tag': {'color': 'grey'},
+    }
+
+
+def test_ref_type_defaults():
+    schema = {
+        'type': 'object',
+        'properties': {
+            'page': {'$ref': '#page'},
+            'sort': {'$ref': '#sort'},
+            # Keywords next to a $ref are ignored
+            'order': {'$ref': '#order', 'default': 'desc'},
+        },
+    }
+    assert _fill(schema, {}) == {'page': {'size': 20, 'order': 'asc'}, 'sort': 'asc', 'order': 'asc'}
+    assert _fill(schema, {'page': {'size': 5}, 'sort': 'desc'}) == {
+        'page': {'size': 5, 'order': 'asc'},
+        'sort': 'desc',
+        'order': 'asc',
+    }
+
+
+def test_mutable_defaults_copied():
+    default = {'items': []}
+    schema = {'type': 'object', 'properties': {'cart': {'type': 'object', 'default': default}}}
+    first = _fill(schema, {})
+    first['cart']['items'].append(1)
+    assert _fill(schema, {}) == {'cart': {'items': []}}
+    assert default == {'items': []}
+
+
+def test_recursive_ref():
+    tree = _fill({'$ref': '#tree'}, {'children': [{'children': [{'label': 'leaf'}, {}]}]})
+    assert tree == {
+        'label': '',
+        'children': [{'label': '', 'children': [{'label': 'leaf'}, {'label': ''}]}],
+    }
+
+
+def test_all_of():
+    schema = {
+        'allOf': [
+            {'properties': {'a': {'default': 1}}},
+            {'properties': {'b': {'default': 2}}},
+        ]
+    }
+    assert _fill(schema, {'b': 3}) == {'a': 1, 'b': 3}
+
+
+def test_skipped_keywords():
+    schema = {
+        'type': 'object',
+        'properties': {'choice': {'anyOf': [{'properties': {'x': {'default': 1}}}]}},
+        'additionalProperties': {'properties': {'y': {'default': 2}}},
+    }
+    assert compile_defaults(schema, _REFS) is None
@@ -0,0 +1,57 @@
+import pytest
+
+from brontosaurus import API
+from brontosaurus.compile_dispatch import compile_dispatch
+from brontosaurus.compile_validators import compile_validators
+
+from test.examples import paths, pet_shop
+
+
+def test_subpaths():
+    dispatch = compile_dispatch(paths.api)
+    assert set(dispatch.methods) == {(None, 'hello'), ('subpath1', 'hello'), ('subpath2', 'hello')}
+    assert dispatch.methods[('subpath1', 'hello')].func is paths.subpath1_hello
+    assert dispatch.apis[None] is paths.api
+    assert dispatch.apis['subpath2'] is paths.subpath2
+
+
+def test_method_records():
+    compile_validators(pet_shop.api)
+    dispatch = compile_dispatch(pet_shop.api)
+    meth = dispatch.methods[(None, 'delete_pet')]
+    assert meth.params_validator is not None
+    assert meth.result_validator is None
+    assert not meth.is_async
+    ((key, regex),) = meth.headers
+    assert key == 'Authorization'
+    assert regex.match('token xyz')
+    assert dispatch.methods[(None, 'get_store_inventory')].params_validator is None
+
+
+def test_read_only():
+    dispatch = compile_dispatch(paths.api)
+    with pytest.raises(TypeError):
+        dispatch.methods[(None, 'goodbye')] = None
+    with pytest.raises(AttributeError):
+        dispatch.methods[(None, 'hello')].extra = True
+
+
+def test_result_validation_rate():
+    api = API('Rates', 'Result validation rates', doc_path=None)
+
+    @api.method('sampled', 'Sampled')
+    @api.result({'type': 'string'}, validation_rate=0.25)
+    def sampled(params, headers):
+        return 'x'
+
+    @api.method('default', 'Default rate')
+    @api.result({'type': 'string'})
+    def default(params, headers):
+        return 'x'
+
+    compile_validators(api)
+    dispatch = compile_dispatch(api)
+    assert dispatch.methods[(None, 'sampled')].result_validation_rate == 0.25
+    assert dispatch.methods[(None, 'default')].result_validation_rate is None
+    with pytest.raises(ValueError):
+        api.result({'type': 'string'}, validation_rate=2)
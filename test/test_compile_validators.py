@@ -0,0 +1,47 @@
+import jsonschema
+import pytest
+
+from brontosaurus.compile_validators import compile_validators, validate
+
+from test.examples.pet_shop import api
+
+
+def setup_module(module):
+    compile_validators(api)
+
+
+def _get_method(name):
+    return api.methods[api.method_names[name]]
+
+
+def test_valid_params():
+    meth = _get_method('create_order')
+    validate(meth['params_validator'], {'petId': 1, 'quantity': 2})
+
+
+def test_same_error_as_jsonschema():
+    """
+    Compiled validators raise the same error as `jsonschema.validate`.
+    """
+    meth = _get_method('update_user')
+    params = {'username_to_update': 123, 'user': {'password': 'x'}}
+    with pytest.raises(jsonschema.exceptions.ValidationError) as expected:
+        jsonschema.validate(params, meth['params_schema'])
+    with pytest.raises(jsonschema.exceptions.ValidationError) as err:
+        validate(meth['params_validator'], params)
+    assert err.value.message == expected.value.message
+    assert err.value.validator == expected.value.validator
+    assert list(err.value.absolute_path) == list(expected.value.absolute_path)
+
+
+def test_registered_refs():
+    """
+    References to registered schemas are resolved.
+    """
+    meth = _get_method('create_pet')
+    params = {'name': 'Buster', 'status': 'available', 'category': {'id': 1, 'name': 'dogs'}}
+    validate(meth['params_validator'], params)
+    params['category']['id'] = 'x'
+    with pytest.raises(jsonschema.exceptions.ValidationError) as err:
+        validate(meth['params_validator'], params)
+    assert list(err.value.absolute_path) == ['category', 'id']
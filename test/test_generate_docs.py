@@ -1,8 +1,107 @@
+import os
+
+from brontosaurus import API
 from brontosaurus.generate_docs import generate_docs
 
+from test.examples.paths import api as paths_api
 from test.examples.pet_shop import api
 # from test.examples.json_schema_types import api
 
 
 def test_docs():
     generate_docs(api)
+
+
+def test_example_docs_up_to_date():
+    """
+    The checked-in example docs are left as they are
+    """
+    doc_paths = [api.doc_path, paths_api.doc_path] + [sub.doc_path for sub in paths_api.subpaths.values()]
+    before = {}
+    for path in doc_paths:
+        with open(path) as fd:
+            before[path] = fd.read()
+    generate_docs(api)
+    generate_docs(paths_api)
+    for path in doc_paths:
+        with open(path) as fd:
+            assert fd.read() == before[path]
+
+
+def _small_api(doc_path):
+    small = API('Small', 'A small API', doc_path)
+
+    @small.method('echo', 'Echo the params')
+    @small.params({'type': 'object', 'properties': {'x': {'type': 'integer'}}})
+    def echo(params, headers):
+        return params
+
+    return small
+
+
+def test_docs_unchanged_are_skipped(tmp_path):
+    doc_path = str(tmp_path / 'API.md')
+    small = _small_api(doc_path)
+    generate_docs(small)
+    with open(doc_path) as fd:
+        content = fd.read()
+    assert content.startswith('<!-- Generated by brontosaurus. Content hash: ')
+    # Backdate the file, so that a rewrite would change its mtime
+    os.utime(doc_path, (0, 0))
+    generate_docs(small)
+    assert os.stat(doc_path).st_mtime == 0
+    with open(doc_path) as fd:
+        assert fd.read() == content
+    # Identical APIs give identical docs
+    generate_docs(_small_api(doc_path))
+    assert os.stat(doc_path).st_mtime == 0
+    assert os.listdir(tmp_path) == ['API.md']
+
+
+def test_docs_changed_are_regenerated(tmp_path):
+    doc_path = str(tmp_path / 'API.md')
+    small = _small_api(doc_path)
+    generate_docs(small)
+    with open(doc_path) as fd:
+        first = fd.read()
+    os.chmod(doc_path, 0o640)
+
+    @small.method('ping', 'Check the server')
+    def ping(params, headers):
+        return 'pong'
+
+    generate_docs(small)
+    with open(doc_path) as fd:
+        second = fd.read()
+    assert second != first
+    assert first.split('\n', 1)[0] != second.split('\n', 1)[0]
+    assert '[ping](#ping)' in second
+    # The permissions of the existing file are kept, and no temporary files are left behind
+    assert os.stat(doc_path).st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ['API.md']
+
+
+def test_docs_all_of(tmp_path):
+    doc_path = str(tmp_path / 'API.md')
+    small = API('Small', 'A small API', doc_path)
+    small.register({
+        '$id': '#named',
+        'allOf': [
+            {'required': ['name'], 'properties': {'name': {'type': 'string'}}},
+            {'properties': {'age': {'type': 'integer'}}},
+        ],
+    })
+    generate_docs(small)
+    with open(doc_path) as fd:
+        content = fd.read()
+    # Each schema of the allOf is rendered once, under its own list item
+    assert (
+        '* Must match all of:\n'
+        '  1. JSON object\n'
+        '    * Required fields: **name**\n'
+        '    * Properties:\n'
+        '      * `"name"` – required string\n'
+        '  1. JSON object\n'
+        '    * Properties:\n'
+        '      * `"age"` – integer\n'
+    ) in content
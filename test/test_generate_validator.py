@@ -0,0 +1,67 @@
+from brontosaurus.compile_validators import create_validator
+from brontosaurus.generate_validator import generate_validator
+
+from test.examples.pet_shop import api
+from test.examples import json_schema_types
+
+# A mix of valid and invalid instances to compare against jsonschema
+_INSTANCES = [
+    None, True, False, 0, 1, -1, 1.5, 2.0, '', 'x', 'available', 'áb', [], [1, 'x'], [True, 2.0],
+    {}, {'id': 1}, {'id': 1.0}, {'id': True}, {'id': '1'}, {'id': 1, 'extra': 1},
+    {'petId': 1, 'quantity': 0}, {'petId': -1, 'quantity': 1}, {'petId': 1, 'quantity': 1},
+    {'username': 'ab'}, {'username': 'abc'}, {'any_status': ['sold', 'xyz']}, {'any_status': ['sold']},
+    {'name': 'Buster', 'status': 'sold', 'category': {'id': 1, 'name': 'dogs'}},
+    {'name': 'Buster', 'status': 'sold', 'category': {'id': 'x', 'name': 'dogs'}},
+    {'foo': 1, 'bar': 2, 'vroom': 3}, {'foo': True, 'quux': False}, {'á': 1, 'b': 2},
+]
+
+
+def _assert_same_as_jsonschema(schema, refs):
+    check = generate_validator(schema, refs)
+    assert check is not None
+    validator = create_validator(schema, refs)
+    for instance in _INSTANCES:
+        assert check(instance) == validator.is_valid(instance), (schema, instance)
+
+
+def test_pet_shop_schemas():
+    for meth in api.methods.values():
+        for key in ('params_schema', 'result_schema'):
+            if key in meth:
+                _assert_same_as_jsonschema(meth[key], api.refs)
+
+
+def test_json_schema_types():
+    for schema in json_schema_types.api.refs.values():
+        _assert_same_as_jsonschema(schema, json_schema_types.api.refs)
+
+
+def test_combinators():
+    schema = {
+        'properties': {
+            'a': {'enum': [1, True, 'x', None]},
+            'b': {'const': 0},
+            'c': {'anyOf': [{'type': 'string', 'pattern': '^a'}, {'type': 'integer', 'exclusiveMaximum': 3}]},
+            'd': {'oneOf': [{'minimum': 1}, {'maximum': 5}]},
+            'e': {'not': {'type': 'null'}},
+        }
+    }
+    check = generate_validator(schema)
+    validator = create_validator(schema, {})
+    instances = [{'a': a, 'b': b, 'c': c, 'd': d, 'e': e}
+                 for a in (1, True, 1.0, 'y')
+                 for b in (0, False, 0.0)
+                 for c in ('abc', 'b', 2, 3)
+                 for d in (0, 3, 6)
+                 for e in (None, 1)]
+    for instance in instances:
+        assert check(instance) == validator.is_valid(instance), instance
+
+
+def test_unsupported_features():
+    """
+    Schemas using features that are not compiled fall back to jsonschema.
+    """
+    assert generate_validator({'type': 'number', 'multipleOf': 3}) is None
+    assert generate_validator({'properties': {'x': {'$ref': '#unknown'}}}) is None
+    assert generate_validator({'$schema': 'http://json-schema.org/draft-04/schema#'}) is None
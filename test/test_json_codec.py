@@ -0,0 +1,41 @@
+import pytest
+
+from brontosaurus.json_codec import available_codecs, get_json_codec, JSONCodec
+
+_VALUE = {'jsonrpc': '2.0', 'id': 1, 'result': [1, 2.5, 'sné', None, True, {'url': 'https://example.com/x'}]}
+
+
+def test_stdlib_codec():
+    codec = get_json_codec('json')
+    assert codec.name == 'json'
+    encoded = codec.dumps(_VALUE)
+    assert isinstance(encoded, bytes)
+    assert b' ' not in encoded
+    assert codec.loads(encoded) == _VALUE
+    assert codec.loads(encoded.decode()) == _VALUE
+
+
+def test_available_codecs():
+    names = available_codecs()
+    assert names[0] == 'json'
+    for name in names:
+        codec = get_json_codec(name)
+        assert codec.loads(codec.dumps(_VALUE)) == _VALUE
+        assert codec.dumps([1, 'a/b']) == b'[1,"a/b"]'
+        assert codec.loads(codec.dumps({1: 'a'})) == {'1': 'a'}
+
+
+def test_auto_codec():
+    fastest = [name for name in ('orjson', 'ujson', 'json') if name in available_codecs()][0]
+    assert get_json_codec().name == fastest
+    assert get_json_codec('auto').name == fastest
+
+
+def test_custom_codec():
+    codec = JSONCodec('custom', lambda data: 1, lambda value: b'1')
+    assert get_json_codec(codec) is codec
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_json_codec('xyz')
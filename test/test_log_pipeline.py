@@ -0,0 +1,54 @@
+import logging
+import logging.config
+import os
+import queue
+import tempfile
+
+from brontosaurus.log_pipeline import DroppingQueueHandler, LogPipeline
+
+
+def _record(msg, name='sanic.root', **extra):
+    record = logging.LogRecord(name, logging.INFO, __file__, 0, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_drop_when_full():
+    records = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(records)
+    for idx in range(5):
+        handler.handle(_record(f'message {idx}'))
+    assert handler.dropped == 3
+    assert [records.get_nowait().getMessage() for _ in range(2)] == ['message 0', 'message 1']
+    handler.handle(_record('message 5'))
+    assert handler.dropped == 0
+    assert records.get_nowait().getMessage() == 'Dropped 3 log records because the log queue was full'
+    assert records.get_nowait().getMessage() == 'message 5'
+
+
+def test_pipeline():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, 'logs', 'app.log')
+        pipeline = LogPipeline(development=True, log_path=log_path)
+        logging.config.dictConfig(pipeline.log_config())
+        pipeline.start()
+        try:
+            logging.getLogger('sanic.root').debug('root message')
+            logging.getLogger('sanic.error').error('error message')
+            extra = {'host': '127.0.0.1:1234', 'request': 'POST /', 'status': 200}
+            logging.getLogger('sanic.access').info('', extra=extra)
+        finally:
+            pipeline.stop()
+            logging.config.dictConfig({'version': 1, 'disable_existing_loggers': False})
+        with open(log_path) as fd:
+            lines = fd.read().splitlines()
+    assert len(lines) == 3
+    assert lines[0].endswith('DEBUG    root message')
+    assert lines[1].endswith('ERROR    error message')
+    assert lines[2].endswith('INFO     127.0.0.1:1234 POST / -> 200')
+
+
+def test_production_level():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pipeline = LogPipeline(development=False, log_path=os.path.join(tmp_dir, 'app.log'))
+        assert pipeline.log_config()['loggers']['sanic.root']['level'] == 'WARNING'
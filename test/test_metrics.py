@@ -0,0 +1,111 @@
+import multiprocessing
+
+from brontosaurus import API
+from brontosaurus.compile_dispatch import compile_dispatch
+from brontosaurus.metrics import MAX_ERROR_CODES, Metrics
+
+from test.examples import paths
+
+
+def _lines(metrics):
+    return dict(line.rsplit(' ', 1) for line in metrics.render().splitlines() if not line.startswith('#'))
+
+
+def test_record():
+    dispatch = compile_dispatch(paths.api)
+    metrics = Metrics(dispatch)
+    metrics.start_worker()
+    meth = dispatch.methods[('subpath1', 'hello')]
+    metrics.record(meth, None, 0.002)
+    metrics.record(meth, -32602, 0.02)
+    metrics.record(meth, -32099, 20)
+    lines = _lines(metrics)
+    labels = 'path="subpath1",method="hello"'
+    assert lines[f'brontosaurus_calls_total{{{labels}}}'] == '3'
+    assert lines[f'brontosaurus_errors_total{{{labels},code="-32602"}}'] == '1'
+    assert lines[f'brontosaurus_errors_total{{{labels},code="-32099"}}'] == '1'
+    assert f'brontosaurus_errors_total{{{labels},code="-32000"}}' not in lines
+    assert f'brontosaurus_errors_total{{{labels},code="other"}}' not in lines
+    assert lines[f'brontosaurus_call_duration_seconds_bucket{{{labels},le="0.001"}}'] == '0'
+    assert lines[f'brontosaurus_call_duration_seconds_bucket{{{labels},le="0.0025"}}'] == '1'
+    assert lines[f'brontosaurus_call_duration_seconds_bucket{{{labels},le="0.025"}}'] == '2'
+    assert lines[f'brontosaurus_call_duration_seconds_bucket{{{labels},le="10.0"}}'] == '2'
+    assert lines[f'brontosaurus_call_duration_seconds_bucket{{{labels},le="+Inf"}}'] == '3'
+    assert lines[f'brontosaurus_call_duration_seconds_count{{{labels}}}'] == '3'
+    assert float(lines[f'brontosaurus_call_duration_seconds_sum{{{labels}}}']) == 20.022
+    assert lines['brontosaurus_calls_total{path="",method="hello"}'] == '0'
+
+
+def test_result_checks():
+    dispatch = compile_dispatch(paths.api)
+    metrics = Metrics(dispatch)
+    meth = dispatch.methods[(None, 'hello')]
+    metrics.record_result_check(meth, True)
+    metrics.record_result_check(meth, False)
+    lines = _lines(metrics)
+    assert lines['brontosaurus_results_validated_total{path="",method="hello"}'] == '2'
+    assert lines['brontosaurus_result_violations_total{path="",method="hello"}'] == '1'
+    assert lines['brontosaurus_calls_total{path="",method="hello"}'] == '0'
+
+
+def test_cache():
+    api = API('Cached', 'A cached API', doc_path=None)
+
+    @api.method('cached', 'A cached method')
+    @api.cache()
+    def cached(params, headers):
+        return params
+
+    @api.method('uncached', 'A method without a cache')
+    def uncached(params, headers):
+        return params
+
+    dispatch = compile_dispatch(api)
+    metrics = Metrics(dispatch)
+    meth = dispatch.methods[(None, 'cached')]
+    metrics.record_cache(meth, False)
+    metrics.record_cache(meth, True)
+    metrics.record_cache(meth, True)
+    lines = _lines(metrics)
+    assert lines['brontosaurus_cache_hits_total{path="",method="cached"}'] == '2'
+    assert lines['brontosaurus_cache_misses_total{path="",method="cached"}'] == '1'
+    # Only cached methods get cache counters
+    assert 'brontosaurus_cache_hits_total{path="",method="uncached"}' not in lines
+
+
+def test_other_error_codes():
+    dispatch = compile_dispatch(paths.api)
+    metrics = Metrics(dispatch)
+    meth = dispatch.methods[(None, 'hello')]
+    for code in range(MAX_ERROR_CODES + 2):
+        metrics.record(meth, code, 0.001)
+    metrics.record(meth, 'not a number', 0.001)
+    metrics.record(meth, 0, 0.001)
+    lines = _lines(metrics)
+    labels = 'path="",method="hello"'
+    assert lines[f'brontosaurus_errors_total{{{labels},code="0"}}'] == '2'
+    assert lines[f'brontosaurus_errors_total{{{labels},code="{MAX_ERROR_CODES - 1}"}}'] == '1'
+    assert f'brontosaurus_errors_total{{{labels},code="{MAX_ERROR_CODES}"}}' not in lines
+    assert lines[f'brontosaurus_errors_total{{{labels},code="other"}}'] == '3'
+
+
+def _record_calls(metrics, meth, count):
+    metrics.start_worker()
+    for _ in range(count):
+        metrics.record(meth, None, 0.001)
+    metrics.record(meth, -32001, 0.001)
+
+
+def test_workers():
+    dispatch = compile_dispatch(paths.api)
+    metrics = Metrics(dispatch, workers=3)
+    meth = dispatch.methods[(None, 'hello')]
+    procs = [multiprocessing.Process(target=_record_calls, args=(metrics, meth, 1000)) for _ in range(3)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    lines = _lines(metrics)
+    assert lines['brontosaurus_calls_total{path="",method="hello"}'] == '3003'
+    # The workers share the counters of each error code
+    assert lines['brontosaurus_errors_total{path="",method="hello",code="-32001"}'] == '3'
@@ -0,0 +1,45 @@
+import json
+import pytest
+
+from brontosaurus.parse_json_array import JSONArrayParser
+
+
+def _parse(body, chunk_size):
+    parser = JSONArrayParser()
+    items = []
+    data = body.encode()
+    for idx in range(0, len(data), chunk_size):
+        items.extend(parser.feed(data[idx:idx + chunk_size]))
+    items.extend(parser.close())
+    return (parser.is_array, items)
+
+
+def test_array_in_chunks():
+    value = [1, -12.5e3, 123456, 'sné"x', {'a': [1, {'b': None}]}, [], True, None, 'x' * 50]
+    for body in (json.dumps(value), json.dumps(value, separators=(',', ':')), f' \n{json.dumps(value)} '):
+        for size in (1, 2, 3, 7, 64, 10000):
+            assert _parse(body, size) == (True, value), (body, size)
+    assert _parse('[]', 1) == (True, [])
+
+
+def test_elements_decoded_early():
+    parser = JSONArrayParser()
+    assert parser.feed(b'[{"id": 1}, {"id"') == [{'id': 1}]
+    assert parser.is_array
+    assert parser.feed(b': 2}, 3') == [{'id': 2}]
+    assert parser.feed(b'4]') == [34]
+    assert parser.close() == []
+    assert parser.count == 3
+
+
+def test_not_an_array():
+    assert _parse('{"method": "x"}', 3) == (False, [{'method': 'x'}])
+    assert _parse('12', 1) == (False, [12])
+    assert _parse('', 1) == (False, [None])
+
+
+@pytest.mark.parametrize('body', ['[1,', '[1 2]', '[1]x', '[x]', '{', '  ', '[1,]', '[', '[]]', '[1]\xff'])
+def test_invalid_json(body):
+    for size in (1, 100):
+        with pytest.raises(ValueError):
+            _parse(body, size)
@@ -0,0 +1,102 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+from brontosaurus.process_pool import ProcessPool
+
+
+def _pid_square(n):
+    return (os.getpid(), n * n)
+
+
+def _fail(msg):
+    raise ValueError(msg)
+
+
+def _unpicklable():
+    return lambda: None
+
+
+def _crash():
+    os._exit(1)
+
+
+def _exit():
+    sys.exit('bye')
+
+
+def _run_in_worker(pool, results):
+    """
+    Use the pool from a daemonic process, which can't start processes itself.
+    """
+    loop = asyncio.new_event_loop()
+    pool.start_worker(loop)
+    result = loop.run_until_complete(pool.run(_pid_square, 3))
+    pool.stop_worker()
+    results.put(result[1])
+
+
+def test_run():
+    pool = ProcessPool(processes=2)
+    pool.start()
+    loop = asyncio.new_event_loop()
+    pool.start_worker(loop)
+    try:
+        results = loop.run_until_complete(asyncio.gather(*[pool.run(_pid_square, n) for n in range(10)]))
+        assert [square for (_, square) in results] == [n * n for n in range(10)]
+        assert os.getpid() not in {pid for (pid, _) in results}
+        with pytest.raises(ValueError, match='oops'):
+            loop.run_until_complete(pool.run(_fail, 'oops'))
+        with pytest.raises(TypeError, match='Result could not be pickled'):
+            loop.run_until_complete(pool.run(_unpicklable))
+        # Functions that can't be pickled fail before being sent
+        with pytest.raises(Exception):
+            pool.run(lambda: None)
+    finally:
+        pool.stop_worker()
+        pool.stop()
+        loop.close()
+    assert pool.processes == []
+
+
+def test_daemonic_workers():
+    pool = ProcessPool(processes=1, workers=2)
+    pool.start()
+    results = multiprocessing.Queue()
+    try:
+        workers = [multiprocessing.Process(target=_run_in_worker, args=(pool, results), daemon=True)
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert [results.get(timeout=5) for _ in workers] == [9, 9]
+    finally:
+        pool.stop()
+
+
+def test_dead_process():
+    pool = ProcessPool(processes=1)
+    pool.start()
+    loop = asyncio.new_event_loop()
+    pool.start_worker(loop)
+    try:
+        (pid, _) = loop.run_until_complete(pool.run(_pid_square, 2))
+        # Exiting from a call is caught, and keeps the process running
+        with pytest.raises(RuntimeError, match='SystemExit raised: bye'):
+            loop.run_until_complete(pool.run(_exit))
+        assert loop.run_until_complete(pool.run(_pid_square, 2)) == (pid, 4)
+        # The call of a process that dies fails, and the process is replaced
+        with pytest.raises(BrokenProcessPool, match='exited with code 1'):
+            loop.run_until_complete(asyncio.wait_for(pool.run(_crash), 5))
+        (new_pid, square) = loop.run_until_complete(asyncio.wait_for(pool.run(_pid_square, 3), 5))
+        assert square == 9
+        assert new_pid != pid
+    finally:
+        pool.stop_worker()
+        pool.stop()
+        loop.close()
@@ -0,0 +1,43 @@
+import time
+
+from brontosaurus.result_cache import MISSING, ResultCache, make_key
+
+
+def test_hits_and_misses():
+    cache = ResultCache()
+    key = make_key({'b': 1, 'a': [1, 2]}, {})
+    assert cache.get(key) is MISSING
+    cache.set(key, None)
+    # Keys do not depend on the order of the params
+    assert cache.get(make_key({'a': [1, 2], 'b': 1}, {})) is None
+    assert cache.info() == {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 128, 'ttl': None}
+
+
+def test_lru_eviction():
+    cache = ResultCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    # 'b' was the least recently used entry
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_ttl():
+    cache = ResultCache(ttl=0.05)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is MISSING
+    assert cache.info()['size'] == 0
+
+
+def test_header_keys():
+    names = ['Authorization']
+    key1 = make_key({}, {'Authorization': 'token 1', 'Other': 'x'}, names)
+    key2 = make_key({}, {'Authorization': 'token 2', 'Other': 'x'}, names)
+    key3 = make_key({}, {'Authorization': 'token 1', 'Other': 'y'}, names)
+    assert key1 != key2
+    assert key1 == key3
@@ -0,0 +1,42 @@
+import asyncio
+import concurrent.futures
+import threading
+
+from brontosaurus.result_stream import ResultStream
+
+
+def _blocking_items(started, release, closed):
+    try:
+        yield 1
+        started.set()
+        release.wait(5)
+        yield 2
+    finally:
+        closed.set()
+
+
+def test_collect():
+    loop = asyncio.new_event_loop()
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        stream = ResultStream((n for n in range(250)), executor, batch_size=100)
+        assert loop.run_until_complete(stream.collect()) == list(range(250))
+    loop.close()
+
+
+def test_cancel_during_batch():
+    """
+    Cancelling while a batch is pulled in the executor closes the generator once the batch is done
+    """
+    (started, release, closed) = (threading.Event(), threading.Event(), threading.Event())
+    loop = asyncio.new_event_loop()
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        stream = ResultStream(_blocking_items(started, release, closed), executor)
+        task = loop.create_task(stream.collect())
+        loop.run_until_complete(loop.run_in_executor(None, started.wait, 5))
+        task.cancel()
+        loop.run_until_complete(asyncio.wait([task]))
+        assert task.cancelled()
+        assert not closed.is_set()
+        release.set()
+        assert closed.wait(5)
+    loop.close()
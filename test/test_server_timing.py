@@ -0,0 +1,33 @@
+import time
+
+from brontosaurus.server_timing import NO_TIMER, PhaseTimer, format_timings, start_timer
+
+
+def test_phase_timer():
+    timings = {}
+    timer = PhaseTimer(timings)
+    time.sleep(0.01)
+    timer.lap('handler')
+    timer.lap('encode')
+    assert list(timings) == ['handler', 'encode']
+    assert timings['handler'] >= 0.01
+    assert timings['encode'] < timings['handler']
+
+
+def test_shared_timings():
+    timings = {}
+    for _ in range(3):
+        timer = start_timer(timings)
+        time.sleep(0.005)
+        timer.lap('handler')
+    assert timings['handler'] >= 0.015
+
+
+def test_no_timer():
+    assert start_timer(None) is NO_TIMER
+    NO_TIMER.lap('handler')
+    assert NO_TIMER.timings is None
+
+
+def test_format_timings():
+    assert format_timings({'parse': 0.0001234, 'total': 0.5}) == 'parse;dur=0.123, total;dur=500.000'
@@ -0,0 +1,47 @@
+import jsonschema
+import pytest
+
+from brontosaurus.validate_envelope import json_rpc2_schema, validate_envelope
+
+_VALID = [
+    {'method': 'echo'},
+    {'jsonrpc': '2.0', 'id': 1, 'method': 'echo', 'params': {}},
+    {'id': 'x', 'method': 'echo', 'params': []},
+    {'id': 1.5, 'method': 'echo'},
+    {'id': None, 'method': 'echo', 'extra': 1},
+]
+
+_INVALID = [
+    [],
+    'echo',
+    None,
+    {},
+    {'id': 1},
+    {'method': 123},
+    {'method': None, 'id': {}},
+    {'method': 'echo', 'id': {}},
+    {'method': 'echo', 'id': True},
+    {'method': 'echo', 'id': []},
+    {'method': 'echo', 'params': 'x'},
+    {'method': 'echo', 'params': None},
+    {'method': 'echo', 'jsonrpc': 123},
+    {'method': 'echo', 'jsonrpc': 2.0},
+    {'method': 'echo', 'jsonrpc': '1.0', 'params': 1},
+    {'jsonrpc': '1.0', 'id': {}},
+]
+
+
+@pytest.mark.parametrize('req_json', _VALID)
+def test_valid(req_json):
+    validate_envelope(req_json)
+
+
+@pytest.mark.parametrize('req_json', _INVALID)
+def test_same_error_as_jsonschema(req_json):
+    with pytest.raises(jsonschema.exceptions.ValidationError) as expected:
+        jsonschema.validate(req_json, json_rpc2_schema)
+    with pytest.raises(jsonschema.exceptions.ValidationError) as err:
+        validate_envelope(req_json)
+    assert err.value.message == expected.value.message
+    assert err.value.instance == expected.value.instance
+    assert list(err.value.absolute_path) == list(expected.value.absolute_path)